@@ -0,0 +1,245 @@
+import calendar
+
+from sqlalchemy import column, func, literal, table
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Artist, ArchivedShowRollup, Venue, Show, ShowRollup
+
+# ----------------------------------------------------------------------------#
+# Show rollups.
+#
+# Every show adds to one ShowRollup row per (entity, dimension, bucket) for
+# both its venue and its artist. The dimensions are:
+#   day      bucket 'YYYY-MM-DD' of start_time
+#   month    bucket 'YYYY-MM' of start_time
+#   weekday  bucket ISO weekday '1'..'7' of start_time
+#   genre    bucket is each genre of the other side (artist genres for a
+#            venue, venue genres for an artist)
+# Rows are upserted in the same transaction as the show insert; deletes
+# are only picked up by the nightly reconcile(). Archiving a Show partition
+# moves its share into ArchivedShowRollup, which reconcile() adds back in.
+# ----------------------------------------------------------------------------#
+
+DATE_BUCKETS = (("day", "YYYY-MM-DD"), ("month", "YYYY-MM"), ("weekday", "ID"))
+COLUMNS = ["entity", "entity_id", "dimension", "bucket", "shows", "lead_time_seconds"]
+
+
+def lead_time_seconds(show):
+    if show.created_at is None:
+        return 0
+    return max(0, int((show.start_time - show.created_at).total_seconds()))
+
+
+def show_buckets(start, venue_id, artist_id, venue_genres, artist_genres):
+    buckets = []
+    for entity, entity_id, other_genres in (
+        ("venue", venue_id, artist_genres),
+        ("artist", artist_id, venue_genres),
+    ):
+        buckets.append((entity, entity_id, "day", start.strftime("%Y-%m-%d")))
+        buckets.append((entity, entity_id, "month", start.strftime("%Y-%m")))
+        buckets.append((entity, entity_id, "weekday", str(start.isoweekday())))
+        for genre in set(other_genres or []):
+            buckets.append((entity, entity_id, "genre", genre))
+    return buckets
+
+
+def record_show(show):
+    """Add a newly created (flushed, uncommitted) show to the rollups."""
+    # ids come straight from the form as strings
+    venue_id, artist_id = int(show.venue_id), int(show.artist_id)
+    venue_genres = db.session.query(Venue.genres).filter_by(id=venue_id).scalar()
+    artist_genres = db.session.query(Artist.genres).filter_by(id=artist_id).scalar()
+    lead_time = lead_time_seconds(show)
+    rows = [
+        {
+            "entity": entity,
+            "entity_id": entity_id,
+            "dimension": dimension,
+            "bucket": bucket,
+            "shows": 1,
+            "lead_time_seconds": lead_time,
+        }
+        for entity, entity_id, dimension, bucket in show_buckets(
+            show.start_time, venue_id, artist_id, venue_genres, artist_genres
+        )
+    ]
+
+    statement = insert(ShowRollup.__table__).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=["entity", "entity_id", "dimension", "bucket"],
+        set_={
+            "shows": ShowRollup.shows + statement.excluded.shows,
+            "lead_time_seconds": ShowRollup.lead_time_seconds
+            + statement.excluded.lead_time_seconds,
+        },
+    )
+    db.session.execute(statement)
+
+
+def _aggregate(entity, dimension, source, entity_id, bucket):
+    lead_time = func.greatest(
+        0, func.extract("epoch", source.c.start_time - source.c.created_at)
+    )
+    return db.session.query(
+        literal(entity).label("entity"),
+        entity_id.label("entity_id"),
+        literal(dimension).label("dimension"),
+        bucket.label("bucket"),
+        func.count().label("shows"),
+        func.coalesce(func.sum(lead_time), 0)
+        .cast(db.BigInteger)
+        .label("lead_time_seconds"),
+    ).group_by(entity_id, bucket)
+
+
+def rollup_queries(shows):
+    """Queries for the ShowRollup rows of the shows in shows (Show or one of
+    its partitions), one per entity and dimension."""
+    # genres have to be unnested in a subquery - Postgres doesn't allow
+    # set-returning functions in GROUP BY
+    artist_genres = (
+        db.session.query(
+            shows.c.venue_id,
+            shows.c.start_time,
+            shows.c.created_at,
+            func.unnest(Artist.genres).label("genre"),
+        )
+        .join(Artist, Artist.id == shows.c.artist_id)
+        .subquery()
+    )
+    venue_genres = (
+        db.session.query(
+            shows.c.artist_id,
+            shows.c.start_time,
+            shows.c.created_at,
+            func.unnest(Venue.genres).label("genre"),
+        )
+        .join(Venue, Venue.id == shows.c.venue_id)
+        .subquery()
+    )
+
+    queries = []
+    for entity, entity_id in (
+        ("venue", shows.c.venue_id),
+        ("artist", shows.c.artist_id),
+    ):
+        for dimension, format in DATE_BUCKETS:
+            queries.append(
+                _aggregate(
+                    entity,
+                    dimension,
+                    shows,
+                    entity_id,
+                    func.to_char(shows.c.start_time, format),
+                )
+            )
+    queries.append(
+        _aggregate(
+            "venue",
+            "genre",
+            artist_genres,
+            artist_genres.c.venue_id,
+            artist_genres.c.genre,
+        )
+    )
+    queries.append(
+        _aggregate(
+            "artist",
+            "genre",
+            venue_genres,
+            venue_genres.c.artist_id,
+            venue_genres.c.genre,
+        )
+    )
+    return [query.statement for query in queries]
+
+
+def reconcile():
+    """Rebuild every rollup row from Show and ArchivedShowRollup with
+    set-based SQL.
+
+    Run nightly; it corrects drift from deleted or edited shows.
+    """
+    archived = db.select(*[ArchivedShowRollup.__table__.c[c] for c in COLUMNS])
+    rows = db.union_all(*rollup_queries(Show.__table__), archived).subquery()
+    keys = [rows.c.entity, rows.c.entity_id, rows.c.dimension, rows.c.bucket]
+    combined = db.select(
+        *keys, func.sum(rows.c.shows), func.sum(rows.c.lead_time_seconds)
+    ).group_by(*keys)
+
+    db.session.query(ShowRollup).delete(synchronize_session=False)
+    db.session.execute(ShowRollup.__table__.insert().from_select(COLUMNS, combined))
+    db.session.commit()
+
+
+def archive_rollups(connection, name):
+    """Add the shows of the detached partition name to ArchivedShowRollup.
+
+    Run in the transaction that drops it, so they are counted exactly once.
+    """
+    partition = table(name, *[column(c.name, c.type) for c in Show.__table__.columns])
+    statement = insert(ArchivedShowRollup.__table__).from_select(
+        COLUMNS, db.union_all(*rollup_queries(partition))
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["entity", "entity_id", "dimension", "bucket"],
+        set_={
+            "shows": ArchivedShowRollup.shows + statement.excluded.shows,
+            "lead_time_seconds": ArchivedShowRollup.lead_time_seconds
+            + statement.excluded.lead_time_seconds,
+        },
+    )
+    connection.execute(statement)
+
+
+# ----------------------------------------------------------------------------#
+# Dashboard.
+# ----------------------------------------------------------------------------#
+
+
+def stats_for(entity, entity_id):
+    rows = (
+        db.session.query(
+            ShowRollup.dimension,
+            ShowRollup.bucket,
+            ShowRollup.shows,
+            ShowRollup.lead_time_seconds,
+        )
+        .filter(
+            ShowRollup.entity == entity,
+            ShowRollup.entity_id == entity_id,
+            ShowRollup.dimension != "day",
+        )
+        .all()
+    )
+
+    months, weekdays, genres = [], [], []
+    total_shows = total_lead_time = 0
+    for dimension, bucket, shows, lead_time in rows:
+        if dimension == "month":
+            months.append(
+                {
+                    "month": bucket,
+                    "shows": shows,
+                    "avg_lead_days": round(lead_time / shows / 86400, 1),
+                }
+            )
+            total_shows += shows
+            total_lead_time += lead_time
+        elif dimension == "weekday":
+            weekdays.append(
+                {"weekday": calendar.day_name[int(bucket) - 1], "shows": shows}
+            )
+        elif dimension == "genre":
+            genres.append({"genre": bucket, "shows": shows})
+
+    return {
+        "total_shows": total_shows,
+        "avg_lead_days": round(total_lead_time / total_shows / 86400, 1)
+        if total_shows
+        else 0,
+        "months": sorted(months, key=lambda month: month["month"]),
+        "weekdays": sorted(weekdays, key=lambda day: day["shows"], reverse=True),
+        "genres": sorted(genres, key=lambda genre: genre["shows"], reverse=True),
+    }
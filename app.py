@@ -1,11 +1,13 @@
 import json
+from datetime import timedelta
 import dateutil.parser
 import babel
 import sys
-from models import db, Artist, Venue, Show
+from models import db, Artist, Venue, Show, apply_changes
 from flask import (
     Flask,
     render_template,
+    make_response,
     request,
     Response,
     flash,
@@ -13,14 +15,32 @@ from flask import (
     url_for,
     jsonify,
     abort,
+    send_file,
+    send_from_directory,
 )
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-import logging
-from logging import Formatter, FileHandler
+from sqlalchemy import func
+from sqlalchemy.orm.exc import StaleDataError
+import request_logging
 from flask_wtf import Form
 from forms import *
+import recommendations
+import matchmaking
+import images
+import analytics
+from images import image_cache
+from entity_cache import entity_cache
+from online_migrations import backfill_cli
+import serving
+from single_flight import single_flight
+from load_shedding import load_shedder
+from budgets import query_budget
+from show_feed import show_feed
+from partitions import history_start, partitions_cli
+from profiling import profiler
+from sitemaps import sitemap_cli
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -29,8 +49,22 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object("config")
+# optional overrides (route limits, timeouts, ...) without code changes
+app.config.from_envvar("FYYUR_SETTINGS", silent=True)
 db.init_app(app)
 migrate = Migrate(app, db)
+image_cache.init_app(app)
+request_logging.init_app(app)
+entity_cache.init_app(app)
+app.cli.add_command(backfill_cli)
+app.cli.add_command(partitions_cli)
+app.cli.add_command(sitemap_cli)
+serving.init_app(app)
+single_flight.init_app(app)
+load_shedder.init_app(app)
+show_feed.init_app(app)
+profiler.init_app(app)
+recommendations.updates.init_app(app)
 
 # ----------------------------------------------------------------------------#
 # Filters.
@@ -47,6 +81,37 @@ def format_datetime(value, format="medium"):
 
 
 app.jinja_env.filters["datetime"] = format_datetime
+app.jinja_env.globals["thumbnail_url"] = images.thumbnail_url
+
+
+def search_by_name(model, search_term):
+    # 'ilike' is case-insensitive equivalent of 'like'
+    matches = (
+        db.session.query(model.id, model.name)
+        .filter(model.name.ilike(f"%{search_term}%"))
+        .all()
+    )
+    return {
+        "count": len(matches),
+        "data": [{"id": id, "name": name} for id, name in matches],
+    }
+
+
+def normalize_search(search_term):
+    # ilike ignores case, so searches differing only in case or whitespace
+    # run as the same query, which single_flight can then share
+    return " ".join(search_term.lower().split())
+
+
+def expected_version(form):
+    # If-Match takes precedence over the version echoed back by the edit form
+    etag = request.headers.get("If-Match") or form.version.data
+    if not etag:
+        return None
+    try:
+        return int(etag.replace("W/", "").strip().strip('"'))
+    except ValueError:
+        return None
 
 
 # ----------------------------------------------------------------------------#
@@ -55,6 +120,7 @@ app.jinja_env.filters["datetime"] = format_datetime
 
 
 @app.route("/")
+@query_budget(queries=0, render_ms=50)
 def index():
     return render_template("pages/home.html")
 
@@ -64,74 +130,80 @@ def index():
 
 
 @app.route("/venues")
+@query_budget(queries=2, render_ms=100)
 def venues():
     data = []
     now = datetime.now()
-    venues = Venue.query.all()
-
-    locations = db.session.query(Venue.city, Venue.state).distinct(
-        Venue.city, Venue.state
+    venues = (
+        db.session.query(Venue.id, Venue.name, Venue.city, Venue.state)
+        .order_by(Venue.state, Venue.city, Venue.id)
+        .all()
+    )
+    # one grouped query instead of loading every venue's shows
+    upcoming_shows = dict(
+        db.session.query(Show.venue_id, func.count(Show.id))
+        .filter(Show.start_time > now)
+        .group_by(Show.venue_id)
+        .all()
     )
 
-    for location in locations:
-        data.append({"city": location[0], "state": location[1], "venues": []})
-
+    locations = {}
     for venue in venues:
-        upcoming_shows = 0
-        shows = Show.query.filter_by(venue_id=venue.id).all()
-
-        for show in shows:
-            if show.start_time > now:
-                upcoming_shows += 1
-
-        for venue_location in data:
-            if (
-                venue.state == venue_location["state"]
-                and venue.city == venue_location["city"]
-            ):
-                venue_location["venues"].append(
-                    {
-                        "id": venue.id,
-                        "name": venue.name,
-                        "num_upcoming_shows": upcoming_shows,
-                    }
-                )
+        location = (venue.city, venue.state)
+        if location not in locations:
+            locations[location] = {"city": venue.city, "state": venue.state, "venues": []}
+            data.append(locations[location])
+
+        locations[location]["venues"].append(
+            {
+                "id": venue.id,
+                "name": venue.name,
+                "num_upcoming_shows": upcoming_shows.get(venue.id, 0),
+            }
+        )
     return render_template("pages/venues.html", areas=data)
 
 
 @app.route("/venues/search", methods=["POST"])
+@query_budget(queries=1, render_ms=50)
 def search_venues():
-    # 'ilike' is case-sensitive equivalent of 'like'
-    user_input = request.form.get("search_term", None)
-    matching_venues = Venue.query.filter(Venue.name.ilike(f"%{user_input}%"))
-    venue_count = matching_venues.count()
-
-    response = {"count": venue_count, "data": matching_venues}
+    search_term = request.form.get("search_term", "")
+    normalized = normalize_search(search_term)
+    response = single_flight.do(
+        ("search_venues", normalized),
+        lambda: search_by_name(Venue, normalized),
+    )
 
     return render_template(
         "pages/search_venues.html",
         results=response,
-        search_term=request.form.get("search_term", ""),
+        search_term=search_term,
     )
 
 
-@app.route("/venues/<int:venue_id>")
-def show_venue(venue_id):
-    venue = Venue.query.get(venue_id)
-    shows_at_venue = Show.query.filter_by(venue_id=venue_id).all()
+def venue_page(venue_id):
+    venue = entity_cache.get(Venue, venue_id)
+    if venue is None:
+        return None
+    shows_at_venue = (
+        db.session.query(Show.artist_id, Show.start_time)
+        .filter(Show.venue_id == venue_id, Show.start_time >= history_start())
+        .all()
+    )
+    artists = entity_cache.get_many(Artist, [show.artist_id for show in shows_at_venue])
 
     past_shows = []
     upcoming_shows = []
     current_time = datetime.now()
 
-    if len(shows_at_venue) > 0:
-        for show in shows_at_venue:
-            data = {
-                "artist_id": show.artist_id,
-                "artist_name": show.artist.name,
-                "artist_image_link": show.artist.image_link,
-                "start_time": format_datetime(str(show.start_time)),
-            }
+    for show in shows_at_venue:
+        artist = artists[show.artist_id]
+        data = {
+            "artist_id": show.artist_id,
+            "artist_name": artist.name,
+            "artist_image_link": artist.image_link,
+            "start_time": format_datetime(str(show.start_time)),
+        }
         if show.start_time > current_time:
             upcoming_shows.append(data)
         else:
@@ -154,22 +226,46 @@ def show_venue(venue_id):
         "upcoming_shows": upcoming_shows,
         "past_shows_count": len(past_shows),
         "upcoming_shows_count": len(upcoming_shows),
+        "history_months": app.config["SHOW_HISTORY_MONTHS"],
     }
+    return data
 
+
+@app.route("/venues/<int:venue_id>")
+@query_budget(queries=3, render_ms=150)
+def show_venue(venue_id):
+    data = single_flight.do(("show_venue", venue_id), lambda: venue_page(venue_id))
+    if data is None:
+        abort(404)
     return render_template("pages/show_venue.html", venue=data)
 
 
+@app.route("/venues/<int:venue_id>/stats")
+@query_budget(queries=2, render_ms=50)
+def venue_stats(venue_id):
+    venue = Venue.query.get_or_404(venue_id)
+    return render_template(
+        "pages/stats.html",
+        name=venue.name,
+        link=url_for("show_venue", venue_id=venue_id),
+        genre_heading="Genres of booked artists",
+        stats=analytics.stats_for("venue", venue_id),
+    )
+
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
 @app.route("/venues/create", methods=["GET"])
+@query_budget(queries=0, render_ms=50)
 def create_venue_form():
     form = VenueForm()
     return render_template("forms/new_venue.html", form=form)
 
 
 @app.route("/venues/create", methods=["POST"])
+@query_budget(queries=1, render_ms=50)
 def create_venue_submission():
     form = VenueForm(request.form, meta={"csrf": False})
 
@@ -203,74 +299,133 @@ def create_venue_submission():
         db.session.add(new_venue)
         db.session.commit()
         flash("Venue created.")
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(e)
+        app.logger.exception("Venue could not be created")
         flash("Error - Venue could not be created")
     finally:
         db.session.close()
     return redirect(url_for("index"))
 
 
-@app.route("/venues/<venue_id>", methods=["DELETE"])
+@app.route("/venues/<int:venue_id>", methods=["DELETE"])
+@query_budget(queries=2, render_ms=50)
 def delete_venue(venue_id):
-
-    venue = Venue.query.get_or_404(venue_id)
-
+    # single DELETE statement - the database cascades to the venue's shows
+    # so they are never loaded into the session
     try:
-        db.session.delete(venue)
+        # past shows are on no one's feed, and there can be many of them
+        show_feed.record_shows("deleted", upcoming=True, venue_id=venue_id)
+        deleted = Venue.query.filter_by(id=venue_id).delete(synchronize_session=False)
         db.session.commit()
-        flash("Venue was deleted")
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(e)
+        app.logger.exception("Venue was not deleted")
         flash("Error - Venue was not deleted")
+        return redirect(url_for("index"))
     finally:
-        db.session.close
-    return redirect(url_for("index"))
+        db.session.close()
 
-    # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-    # clicking that button delete it from the db then redirect the user to the homepage
-    return None
+    if not deleted:
+        abort(404)
+    # bulk deletes skip the session events, so invalidate by hand
+    entity_cache.invalidate(Venue, venue_id)
+    flash("Venue was deleted")
+    return redirect(url_for("index"))
 
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route("/artists")
+@query_budget(queries=1, render_ms=100)
 def artists():
     artists = Artist.query.all()
     return render_template("pages/artists.html", artists=artists)
 
 
 @app.route("/artists/search", methods=["POST"])
+@query_budget(queries=1, render_ms=50)
 def search_artists():
-    # 'ilike' is case-sensitive equivalent of 'like'
-    user_input = request.form.get("search_term", None)
-    matching_artists = Artist.query.filter(Artist.name.ilike(f"%{user_input}%"))
-    artist_count = matching_artists.count()
-
-    response = {
-        "count": artist_count,
-        "data": matching_artists,
-    }
+    search_term = request.form.get("search_term", "")
+    normalized = normalize_search(search_term)
+    response = single_flight.do(
+        ("search_artists", normalized),
+        lambda: search_by_name(Artist, normalized),
+    )
+
     return render_template(
         "pages/search_artists.html",
         results=response,
-        search_term=request.form.get("search_term", ""),
+        search_term=search_term,
     )
 
 
+def artist_page(artist_id):
+    artist = entity_cache.get(Artist, artist_id)
+    if artist is None:
+        return None
+    return {
+        "artist": artist,
+        "similar_artists": recommendations.similar_artists(artist_id),
+        "recommended_venues": recommendations.recommended_venues(artist_id),
+    }
+
+
 @app.route("/artists/<int:artist_id>")
+@query_budget(queries=3, render_ms=100)
 def show_artist(artist_id):
-    artist = Artist.query.get(artist_id)
-    return render_template("pages/show_artist.html", artist=artist)
+    data = single_flight.do(("show_artist", artist_id), lambda: artist_page(artist_id))
+    if data is None:
+        abort(404)
+    return render_template("pages/show_artist.html", **data)
+
+
+@app.route("/artists/<int:artist_id>/stats")
+@query_budget(queries=2, render_ms=50)
+def artist_stats(artist_id):
+    artist = Artist.query.get_or_404(artist_id)
+    return render_template(
+        "pages/stats.html",
+        name=artist.name,
+        link=url_for("show_artist", artist_id=artist_id),
+        genre_heading="Genres of venues played",
+        stats=analytics.stats_for("artist", artist_id),
+    )
+
+
+@app.route("/artists/<int:artist_id>", methods=["DELETE"])
+@query_budget(queries=2, render_ms=50)
+def delete_artist(artist_id):
+    # single DELETE statement - the database cascades to the artist's shows
+    try:
+        # past shows are on no one's feed, and there can be many of them
+        show_feed.record_shows("deleted", upcoming=True, artist_id=artist_id)
+        deleted = Artist.query.filter_by(id=artist_id).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        app.logger.exception("Artist was not deleted")
+        flash("Error - Artist was not deleted")
+        return redirect(url_for("index"))
+    finally:
+        db.session.close()
+
+    if not deleted:
+        abort(404)
+    # bulk deletes skip the session events, so invalidate by hand
+    entity_cache.invalidate(Artist, artist_id)
+    flash("Artist was deleted")
+    return redirect(url_for("index"))
 
 
 #  Update
 #  ----------------------------------------------------------------
 @app.route("/artists/<int:artist_id>/edit", methods=["GET"])
+@query_budget(queries=1, render_ms=50)
 def edit_artist(artist_id):
-    artist = Artist.query.get(artist_id)
+    artist = Artist.query.get_or_404(artist_id)
 
     form = ArtistForm(
         id=artist.id,
@@ -284,33 +439,59 @@ def edit_artist(artist_id):
         seeking_venue=artist.seeking_venue,
         seeking_description=artist.seeking_description,
         image_link=artist.image_link,
+        version=artist.version,
     )
 
-    return render_template("forms/edit_artist.html", form=form, artist=artist)
+    response = make_response(
+        render_template("forms/edit_artist.html", form=form, artist=artist)
+    )
+    response.set_etag(str(artist.version))
+    return response
 
 
 @app.route("/artists/<int:artist_id>/edit", methods=["POST"])
+@query_budget(queries=11, render_ms=150)
 def edit_artist_submission(artist_id):
-    artist = Artist.query.get(artist_id)
+    artist = Artist.query.get_or_404(artist_id)
     form = ArtistForm(request.form, meta={"csrf": False})
+    version = expected_version(form)
+
+    if version is not None and version != artist.version:
+        flash("Error - Artist was changed by someone else, please review")
+        return edit_artist(artist_id), 409
 
     try:
-        artist.name = form.name.data.strip()
-        artist.city = form.city.data.strip()
-        artist.state = form.state.data.strip()
-        artist.phone = form.phone.data.strip()
-        artist.genres = request.form.getlist("genres")
-        artist.image_link = form.image_link.data.strip()
-        artist.facebook_link = form.facebook_link.data.strip()
-        artist.website = form.website_link.data.strip()
-        artist.seeking_venue = True if form.seeking_venue.data == True else False
-        artist.seeking_description = form.seeking_description.data.strip()
+        changed = apply_changes(
+            artist,
+            {
+                "name": form.name.data.strip(),
+                "city": form.city.data.strip(),
+                "state": form.state.data.strip(),
+                "phone": form.phone.data.strip(),
+                "genres": request.form.getlist("genres"),
+                "image_link": form.image_link.data.strip(),
+                "facebook_link": form.facebook_link.data.strip(),
+                "website": form.website_link.data.strip(),
+                "seeking_venue": True if form.seeking_venue.data == True else False,
+                "seeking_description": form.seeking_description.data.strip(),
+            },
+        )
 
-        db.session.commit()
+        if changed:
+            # names and images shown in the feed come from the artist; past
+            # shows are not on anyone's feed any more
+            show_feed.record_shows("updated", upcoming=True, artist_id=artist_id)
+            db.session.commit()
+        if "genres" in changed:
+            recommendations.updates.submit(artist_id)
         flash("Artist details updated.")
-    except Exception as e:
+    except StaleDataError:
+        db.session.rollback()
+        flash("Error - Artist was changed by someone else, please review")
+        return edit_artist(artist_id), 409
+    except Exception:
         db.session.rollback()
-        print(e)
+        app.logger.exception("Unable to update artist")
         flash("Error - Unable to update artist")
     finally:
         db.session.close()
@@ -318,8 +499,9 @@ def edit_artist_submission(artist_id):
 
 
 @app.route("/venues/<int:venue_id>/edit", methods=["GET"])
+@query_budget(queries=1, render_ms=50)
 def edit_venue(venue_id):
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.get_or_404(venue_id)
 
     form = VenueForm(
         id=venue.id,
@@ -334,34 +516,56 @@ def edit_venue(venue_id):
         seeking_talent=venue.seeking_talent,
         seeking_description=venue.seeking_description,
         image_link=venue.image_link,
+        version=venue.version,
     )
 
-    return render_template("forms/edit_venue.html", form=form, venue=venue)
+    response = make_response(
+        render_template("forms/edit_venue.html", form=form, venue=venue)
+    )
+    response.set_etag(str(venue.version))
+    return response
 
 
 @app.route("/venues/<int:venue_id>/edit", methods=["POST"])
+@query_budget(queries=3, render_ms=50)
 def edit_venue_submission(venue_id):
-    venue = Venue.query.get(venue_id)
+    venue = Venue.query.get_or_404(venue_id)
     form = VenueForm(request.form, meta={"csrf": False})
+    version = expected_version(form)
+
+    if version is not None and version != venue.version:
+        flash("Error - Venue was changed by someone else, please review")
+        return edit_venue(venue_id), 409
 
     try:
-        venue.name = form.name.data.strip()
-        venue.city = form.city.data.strip()
-        venue.state = form.state.data.strip()
-        venue.address = form.address.data.strip()
-        venue.phone = form.phone.data.strip()
-        venue.genres = request.form.getlist("genres")
-        venue.image_link = form.image_link.data.strip()
-        venue.facebook_link = form.facebook_link.data.strip()
-        venue.website_link = form.website_link.data.strip()
-        venue.seeking_talent = True if form.seeking_talent.data == True else False
-        venue.seeking_description = form.seeking_description.data.strip()
+        changed = apply_changes(
+            venue,
+            {
+                "name": form.name.data.strip(),
+                "city": form.city.data.strip(),
+                "state": form.state.data.strip(),
+                "address": form.address.data.strip(),
+                "phone": form.phone.data.strip(),
+                "genres": request.form.getlist("genres"),
+                "image_link": form.image_link.data.strip(),
+                "facebook_link": form.facebook_link.data.strip(),
+                "website": form.website_link.data.strip(),
+                "seeking_talent": True if form.seeking_talent.data == True else False,
+                "seeking_description": form.seeking_description.data.strip(),
+            },
+        )
 
-        db.session.commit()
+        if changed:
+            show_feed.record_shows("updated", upcoming=True, venue_id=venue_id)
+            db.session.commit()
         flash("Venue details updated.")
-    except Exception as e:
+    except StaleDataError:
         db.session.rollback()
-        print(e)
+        flash("Error - Venue was changed by someone else, please review")
+        return edit_venue(venue_id), 409
+    except Exception:
+        db.session.rollback()
+        app.logger.exception("Unable to update venue")
         flash("Error - Unable to update venue")
     finally:
         db.session.close()
@@ -374,12 +578,14 @@ def edit_venue_submission(venue_id):
 
 
 @app.route("/artists/create", methods=["GET"])
+@query_budget(queries=0, render_ms=50)
 def create_artist_form():
     form = ArtistForm()
     return render_template("forms/new_artist.html", form=form)
 
 
 @app.route("/artists/create", methods=["POST"])
+@query_budget(queries=9, render_ms=150)
 def create_artist_submission():
     form = ArtistForm(request.form, meta={"csrf": False})
 
@@ -410,41 +616,188 @@ def create_artist_submission():
 
         db.session.add(new_artist)
         db.session.commit()
+        # after the commit: the background update runs in its own session
+        recommendations.updates.submit(new_artist.id)
         flash("Artist created.")
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(e)
+        app.logger.exception("Artist could not be created")
         flash("Error - Artist could not be created")
     finally:
         db.session.close()
     return redirect(url_for("index"))
 
 
+#  Images
+#  ----------------------------------------------------------------
+
+
+@app.route("/img/<kind>/<int:id>/<size>")
+@query_budget(queries=1, render_ms=50)
+def image(kind, id, size):
+    if kind not in images.KINDS or size not in image_cache.sizes:
+        abort(404)
+    url = image_cache.source_url(kind, id)
+    # anything else is neither fetched nor redirected to
+    if not url or not images.is_web_url(url):
+        abort(404)
+
+    format = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+    try:
+        path = image_cache.get(url, size, format)
+    except Exception:
+        app.logger.exception("Image could not be rendered")
+        path = None
+
+    if path is None:
+        # still rendering (or the source failed) - hand out the original once
+        response = redirect(url)
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    response = send_file(path, mimetype=images.FORMATS[format][1], conditional=True)
+    response.headers["Cache-Control"] = (
+        f"public, max-age={app.config['IMAGE_MAX_AGE']}, immutable"
+    )
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+#  Sitemaps
+#  ----------------------------------------------------------------
+
+
+@app.route("/sitemap.xml")
+@query_budget(queries=0, render_ms=20)
+def sitemap_index():
+    # written by `flask sitemap generate`, see sitemaps.py
+    return send_from_directory(
+        app.config["SITEMAP_DIR"], "sitemap.xml", mimetype="application/xml", max_age=3600
+    )
+
+
+@app.route("/sitemaps/<name>")
+@query_budget(queries=0, render_ms=20)
+def sitemap(name):
+    if not name.endswith(".xml.gz"):
+        abort(404)
+    return send_from_directory(
+        app.config["SITEMAP_DIR"], name, mimetype="application/gzip", max_age=3600
+    )
+
+
+@app.route("/cache/entities")
+@query_budget(queries=0, render_ms=20)
+def entity_cache_stats():
+    return jsonify(entity_cache.stats())
+
+
+@app.route("/cache/single-flight")
+@query_budget(queries=0, render_ms=20)
+def single_flight_stats():
+    return jsonify(single_flight.stats())
+
+
+@app.route("/events/stats")
+@query_budget(queries=0, render_ms=20)
+def show_feed_stats():
+    return jsonify(show_feed.stats())
+
+
+@app.route("/load/stats")
+@query_budget(queries=0, render_ms=20)
+def load_stats():
+    return jsonify(load_shedder.stats())
+
+
+#  Matches
+#  ----------------------------------------------------------------
+
+
+@app.route("/matches/artist/<int:artist_id>")
+@query_budget(queries=2, render_ms=50)
+def artist_matches(artist_id):
+    artist = Artist.query.get_or_404(artist_id)
+    return render_template(
+        "pages/matches.html",
+        name=artist.name,
+        kind="venues",
+        matches=matchmaking.matches_for_artist(artist_id),
+    )
+
+
+@app.route("/matches/venue/<int:venue_id>")
+@query_budget(queries=2, render_ms=50)
+def venue_matches(venue_id):
+    venue = Venue.query.get_or_404(venue_id)
+    return render_template(
+        "pages/matches.html",
+        name=venue.name,
+        kind="artists",
+        matches=matchmaking.matches_for_venue(venue_id),
+    )
+
+
 #  Shows
 #  ----------------------------------------------------------------
 
 
+@app.route("/events/shows")
+@query_budget(queries=0, render_ms=50)
+def show_events():
+    venue_id = request.args.get("venue", type=int)
+    artist_id = request.args.get("artist", type=int)
+    subscriber = show_feed.subscribe(venue_id, artist_id)
+    if subscriber is None:
+        return load_shedder.unavailable("too many subscribers", "events")
+
+    # sent by EventSource when it reconnects
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    try:
+        missed = (
+            show_feed.missed(last_event_id, venue_id, artist_id)
+            if last_event_id is not None
+            else []
+        )
+    except Exception:
+        show_feed.unsubscribe(subscriber)
+        raise
+    return show_feed.response(subscriber, missed)
+
+
 @app.route("/shows")
+@query_budget(queries=3, render_ms=600)
 def shows():
-    all_shows = Show.query.all()
+    all_shows = (
+        db.session.query(Show.venue_id, Show.artist_id, Show.start_time)
+        .filter(Show.start_time >= history_start())
+        .all()
+    )
+    venues = entity_cache.get_many(Venue, [show.venue_id for show in all_shows])
+    artists = entity_cache.get_many(Artist, [show.artist_id for show in all_shows])
     response_data = []
 
     for show in all_shows:
         show_details = {
             "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
+            "venue_name": venues[show.venue_id].name,
             "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
+            "artist_name": artists[show.artist_id].name,
+            "artist_image_link": artists[show.artist_id].image_link,
             "start_time": str(show.start_time),
         }
 
         response_data.append(show_details)
 
-    return render_template("pages/shows.html", shows=response_data)
+    return render_template(
+        "pages/shows.html",
+        shows=response_data,
+        history_months=app.config["SHOW_HISTORY_MONTHS"],
+    )
 
 
 @app.route("/shows/create")
+@query_budget(queries=0, render_ms=50)
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
@@ -452,6 +805,7 @@ def create_shows():
 
 
 @app.route("/shows/create", methods=["POST"])
+@query_budget(queries=5, render_ms=100)
 def create_show_submission():
     form = ShowForm(request.form, meta={"csrf": False})
 
@@ -462,11 +816,14 @@ def create_show_submission():
             start_time=form.start_time.data,
         )
         db.session.add(show)
+        db.session.flush()
+        analytics.record_show(show)
+        show_feed.record_show("created", show)
         db.session.commit()
         flash("Show created")
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(e)
+        app.logger.exception("Show could not be created.")
         flash("Error - Show could not be created.")
     finally:
         db.session.close()
@@ -484,15 +841,28 @@ def server_error(error):
     return render_template("errors/500.html"), 500
 
 
-if not app.debug:
-    file_handler = FileHandler("error.log")
-    file_handler.setFormatter(
-        Formatter("%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]")
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info("errors")
+@app.cli.command("rebuild-recommendations")
+def rebuild_recommendations():
+    similar, recommended = recommendations.rebuild_all()
+    print(f"{similar} similar artist rows, {recommended} recommended venue rows")
+
+
+@app.cli.command("rebuild-matches")
+def rebuild_matches():
+    print(f"{matchmaking.rebuild_all()} artist/venue matches")
+
+
+@app.cli.command("reconcile-stats")
+def reconcile_stats():
+    analytics.reconcile()
+    print("show rollups rebuilt")
+
+
+@app.cli.command("prune-events")
+def prune_events():
+    retention = timedelta(hours=app.config["EVENTS_RETENTION_HOURS"])
+    print(f"{show_feed.prune(retention)} show events pruned")
+
 
 # ----------------------------------------------------------------------------#
 # Launch.
@@ -500,6 +870,7 @@ if not app.debug:
 
 # Default port:
 if __name__ == "__main__":
+    serving.ready.set()
     app.run()
 
 # Or specify port manually:
@@ -0,0 +1,25 @@
+# ----------------------------------------------------------------------------#
+# Performance budgets.
+#
+# Declared next to each route:
+#
+#   @app.route("/venues")
+#   @query_budget(queries=2, render_ms=150)
+#   def venues():
+#
+# and enforced by tests/test_budgets.py, which renders every route against
+# a seeded database and fails when a route issues more SQL statements or
+# takes longer than its budget.
+# ----------------------------------------------------------------------------#
+
+
+def query_budget(queries, render_ms):
+    def decorate(view):
+        view.query_budget = {"queries": queries, "render_ms": render_ms}
+        return view
+
+    return decorate
+
+
+def budget_for(view):
+    return getattr(view, "query_budget", None)
@@ -0,0 +1,266 @@
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Artist, Venue
+
+# ----------------------------------------------------------------------------#
+# Read-through cache for Venue and Artist rows.
+#
+# Rows are cached as namedtuples of column values (not ORM objects) in a
+# bounded in-process LRU, backed by an optional shared tier that stores
+# them JSON encoded. Keys are (model name, id). Committed changes to Venue
+# or Artist invalidate both tiers; the local tier also has a short TTL so
+# other processes pick up changes that were committed elsewhere.
+#
+# Invalidation leaves a tombstone carrying the committed version instead of
+# deleting the key, and a tier only accepts an entry that outranks what it
+# holds. A reader that loaded the row just before a change committed can
+# then no longer put the old row back after the invalidation ran.
+# ----------------------------------------------------------------------------#
+
+CACHED_MODELS = (Venue, Artist)
+# not needed by the pages, and not JSON serializable for the shared tier
+UNCACHED_COLUMNS = {"updated_at"}
+# outranks every row of an entity that was deleted
+DELETED_RANK = 2**53
+
+
+def row_rank(version):
+    return 2 * version
+
+
+def tombstone_rank(version):
+    # above every row older than the committed version, below the row itself
+    return DELETED_RANK if version is None else 2 * version - 1
+
+
+def held_rank(value):
+    # shared tier values are "<rank>|<json row>", or "<rank>|" for a tombstone
+    if value is None:
+        return None
+    rank, sep, _ = value.partition("|")
+    return int(rank) if sep and rank.isdigit() else None
+
+
+class LocalSharedTier:
+    """In-memory stand-in for a shared cache such as redis or memcached."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self.lock:
+            return [self.data.get(key) for key in keys]
+
+    def set_many(self, items, ttl):
+        # items are {key: (rank, value)}
+        with self.lock:
+            for key, (rank, value) in items.items():
+                held = held_rank(self.data.get(key))
+                if held is None or held < rank:
+                    self.data[key] = value
+
+
+class RedisSharedTier:
+    # compare and set in one step, so a concurrent write can't slip between
+    SET_NEWER = """
+    for i, key in ipairs(KEYS) do
+        local current = redis.call("GET", key)
+        local held = current and tonumber(string.match(current, "^(%d+)|"))
+        if not held or held < tonumber(ARGV[i * 2]) then
+            redis.call("SET", key, ARGV[i * 2 + 1], "EX", ARGV[1])
+        end
+    end
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.set_newer = self.client.register_script(self.SET_NEWER)
+
+    def get_many(self, keys):
+        return self.client.mget(keys) if keys else []
+
+    def set_many(self, items, ttl):
+        args = [ttl]
+        for rank, value in items.values():
+            args += [rank, value]
+        self.set_newer(keys=list(items), args=args)
+
+
+class EntityCache:
+    def __init__(self):
+        self.max_entries = 0
+        self.local_ttl = 0
+        self.shared_ttl = 0
+        self.shared = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.row_types = {
+            model.__name__: namedtuple(
+                f"{model.__name__}Row",
+                [
+                    column.key
+                    for column in model.__table__.columns
+                    if column.key not in UNCACHED_COLUMNS
+                ],
+            )
+            for model in CACHED_MODELS
+        }
+
+    def init_app(self, app):
+        self.max_entries = app.config["ENTITY_CACHE_MAX_ENTRIES"]
+        self.local_ttl = app.config["ENTITY_CACHE_LOCAL_TTL"]
+        self.shared_ttl = app.config["ENTITY_CACHE_SHARED_TTL"]
+        shared_url = app.config["ENTITY_CACHE_SHARED_URL"]
+        if shared_url == "local":
+            self.shared = LocalSharedTier()
+        elif shared_url:
+            self.shared = RedisSharedTier(shared_url)
+
+    def key(self, model, id):
+        return f"entity:{model.__name__}:{id}"
+
+    # local tier
+
+    def _local_get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, rank, row = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return row
+
+    def _local_set(self, key, rank, row):
+        # row is None for a tombstone
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] >= rank:
+                return
+            self.entries[key] = (time.monotonic() + self.local_ttl, rank, row)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    # read-through
+
+    def get(self, model, id):
+        return self.get_many(model, [id]).get(id)
+
+    def get_many(self, model, ids):
+        """Return {id: row} for the ids that exist, loading misses in one query."""
+        row_type = self.row_types[model.__name__]
+        found = {}
+        missing = []
+        for id in set(ids):
+            row = self._local_get(self.key(model, id))
+            if row is None:
+                missing.append(id)
+            else:
+                found[id] = row
+        self.hits += len(found)
+
+        if missing and self.shared is not None:
+            values = self.shared.get_many([self.key(model, id) for id in missing])
+            still_missing = []
+            for id, value in zip(missing, values):
+                payload = None if held_rank(value) is None else value.partition("|")[2]
+                if not payload:
+                    still_missing.append(id)
+                    continue
+                row = row_type(*json.loads(payload))
+                found[id] = row
+                self._local_set(self.key(model, id), row_rank(row.version), row)
+                self.shared_hits += 1
+            missing = still_missing
+
+        if missing:
+            self.misses += len(missing)
+            loaded = {}
+            columns = [model.__table__.c[field] for field in row_type._fields]
+            for values in db.session.query(*columns).filter(
+                model.id.in_(missing)
+            ):
+                row = row_type(*values)
+                found[row.id] = row
+                rank = row_rank(row.version)
+                self._local_set(self.key(model, row.id), rank, row)
+                value = f"{rank}|{json.dumps(list(row))}"
+                loaded[self.key(model, row.id)] = (rank, value)
+            if loaded and self.shared is not None:
+                self.shared.set_many(loaded, self.shared_ttl)
+
+        return found
+
+    def invalidate(self, model, id, version=None):
+        """Forget the entity once version has committed; no version means
+        it was deleted."""
+        key = self.key(model, id)
+        rank = tombstone_rank(version)
+        self._local_set(key, rank, None)
+        if self.shared is not None:
+            self.shared.set_many({key: (rank, f"{rank}|")}, self.shared_ttl)
+
+    def stats(self):
+        with self.lock:
+            rows = [row for _, _, row in self.entries.values() if row is not None]
+        total_bytes = sum(row_size(row) for row in rows)
+        return {
+            "entries": len(rows),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "bytes": total_bytes,
+            "bytes_per_entity": round(total_bytes / len(rows), 1) if rows else 0,
+        }
+
+
+def row_size(row):
+    # the tuple plus its field values (and the items of list fields)
+    size = sys.getsizeof(row)
+    for value in row:
+        size += sys.getsizeof(value)
+        if isinstance(value, list):
+            size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+entity_cache = EntityCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    changed = session.info.setdefault("entity_cache_changed", set())
+    for instance in list(session.new) + list(session.dirty):
+        if isinstance(instance, CACHED_MODELS):
+            changed.add((type(instance), instance.id, instance.version))
+    for instance in session.deleted:
+        if isinstance(instance, CACHED_MODELS):
+            changed.add((type(instance), instance.id, None))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for model, id, version in session.info.pop("entity_cache_changed", ()):
+        entity_cache.invalidate(model, id, version)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("entity_cache_changed", None)
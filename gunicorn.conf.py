@@ -0,0 +1,46 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+import signal
+
+bind = os.environ.get("BIND", "0.0.0.0:" + os.environ.get("PORT", "5000"))
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+# gevent workers serve the live show feed (/events/shows): every open
+# stream is a greenlet rather than a thread. They load the app after fork,
+# once gevent has patched the standard library.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+preload_app = worker_class == "gthread"
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 5000))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+accesslog = None
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # psycopg2 waits for the server inside C, which would stall every
+        # greenlet in the worker; make it wait on the gevent hub instead
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+    import serving
+
+    app = worker.app.wsgi()
+    serving.warmup_worker(app)
+
+    # on SIGTERM fail /readyz first and keep serving for DRAIN_SECONDS so the
+    # load balancer stops routing here, then let gunicorn's graceful stop run
+    handle_exit = worker.handle_exit
+
+    def drain_then_exit(sig, frame):
+        serving.drain(app, lambda: handle_exit(sig, frame))
+
+    worker.handle_exit = drain_then_exit
+    signal.signal(signal.SIGTERM, drain_then_exit)
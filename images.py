@@ -0,0 +1,241 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import url_for
+from PIL import Image
+
+from models import db, Artist, Venue
+
+# ----------------------------------------------------------------------------#
+# Image proxy.
+#
+# Source images are fetched once by a background worker, resized, and kept
+# in an on-disk cache addressed by a hash of (source url, size, format).
+# File mtimes double as the LRU clock: hits touch the file and eviction
+# removes the oldest files once the cache is over its byte budget.
+#
+# image_link is user input, so only http(s) sources are fetched and every
+# connection - redirects included - is refused unless the address it
+# reached is a public one.
+# ----------------------------------------------------------------------------#
+
+KINDS = {"venue": Venue, "artist": Artist}
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+SCHEMES = {"http", "https"}
+
+
+class UnsafeURL(ValueError):
+    pass
+
+
+def is_web_url(url):
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme in SCHEMES and bool(parts.hostname)
+
+
+def check_address(address):
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if getattr(ip, "ipv4_mapped", None):
+        ip = ip.ipv4_mapped
+    # private, loopback, link-local, reserved and the like are not global
+    if not ip.is_global or ip.is_multicast:
+        raise UnsafeURL(f"refusing to fetch from {ip}")
+
+
+class _CheckedConnection(http.client.HTTPConnection):
+    def connect(self):
+        # every address the name resolves to is checked before connecting,
+        # and the peer actually reached after, in case it resolved
+        # differently the second time; redirects come through here too
+        addresses = socket.getaddrinfo(self.host, self.port, type=socket.SOCK_STREAM)
+        for *_, sockaddr in addresses:
+            check_address(sockaddr[0])
+        super().connect()
+        try:
+            check_address(self.sock.getpeername()[0])
+        except UnsafeURL:
+            self.close()
+            raise
+
+
+class _CheckedHTTPSConnection(http.client.HTTPSConnection, _CheckedConnection):
+    # HTTPSConnection.connect runs the check before the TLS handshake
+    pass
+
+
+class _HTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_CheckedConnection, req)
+
+
+class _HTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_CheckedHTTPSConnection, req, context=self._context)
+
+
+def _opener():
+    # no proxy, file, ftp or data handlers: http(s) to public addresses only
+    opener = urllib.request.OpenerDirector()
+    for handler in (
+        _HTTPHandler(),
+        _HTTPSHandler(),
+        urllib.request.HTTPRedirectHandler(),
+        urllib.request.HTTPDefaultErrorHandler(),
+        urllib.request.HTTPErrorProcessor(),
+    ):
+        opener.add_handler(handler)
+    return opener
+
+
+def fetch_url(url, timeout, limit):
+    """The default fetcher: up to limit bytes of a public http(s) URL."""
+    if not is_web_url(url):
+        raise UnsafeURL(f"not an http(s) URL: {url}")
+    with _opener().open(url, timeout=timeout) as response:
+        return response.read(limit)
+
+
+class ImageCache:
+    def __init__(self, fetcher=fetch_url):
+        # fetcher(url, timeout, limit) returns the source image bytes
+        self.fetcher = fetcher
+        self.cache_dir = None
+        self.sizes = {}
+        self.max_bytes = 0
+        self.max_source_bytes = 0
+        self.fetch_timeout = 0
+        self.fetch_wait = 0
+        self.workers = 0
+        self.executor = None
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.total_bytes = 0
+
+    def init_app(self, app):
+        self.cache_dir = app.config["IMAGE_CACHE_DIR"]
+        self.sizes = app.config["IMAGE_SIZES"]
+        self.max_bytes = app.config["IMAGE_CACHE_MAX_BYTES"]
+        self.max_source_bytes = app.config["IMAGE_MAX_SOURCE_BYTES"]
+        self.fetch_timeout = app.config["IMAGE_FETCH_TIMEOUT"]
+        self.fetch_wait = app.config["IMAGE_FETCH_WAIT"]
+        self.workers = app.config["IMAGE_FETCH_WORKERS"]
+        self.start_executor()
+        # a forked worker gets the executor but none of its threads
+        os.register_at_fork(after_in_child=self.start_executor)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self.entries())
+
+    def start_executor(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="image-fetch"
+        )
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def source_url(self, kind, id):
+        model = KINDS[kind]
+        row = db.session.query(model.image_link).filter(model.id == id).first()
+        return row[0] if row else None
+
+    def path(self, url, size, format):
+        digest = hashlib.sha256(f"{url}|{size}|{format}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{format}")
+
+    def fetch(self, url):
+        data = self.fetcher(url, self.fetch_timeout, self.max_source_bytes + 1)
+        if len(data) > self.max_source_bytes:
+            raise ValueError(f"image larger than {self.max_source_bytes} bytes: {url}")
+        return data
+
+    def render(self, url, size, format, path):
+        image = Image.open(io.BytesIO(self.fetch(url)))
+        image.thumbnail(self.sizes[size])
+        if format == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write under a temporary name so readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, FORMATS[format][0], quality=80)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.total_bytes += os.path.getsize(path)
+            over_budget = self.total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+        return path
+
+    def get(self, url, size, format):
+        """Return the cached thumbnail path, or None if it isn't ready yet.
+
+        A miss schedules one background render per (url, size, format) and
+        waits up to fetch_wait seconds for it.
+        """
+        path = self.path(url, size, format)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+
+        with self.lock:
+            future = self.pending.get(path)
+            if future is None:
+                future = self.executor.submit(self.render, url, size, format, path)
+                self.pending[path] = future
+                future.add_done_callback(lambda _: self.pending.pop(path, None))
+
+        try:
+            return future.result(timeout=self.fetch_wait)
+        except TimeoutError:
+            return None
+
+    def entries(self):
+        # (mtime, size, path) of every cached file
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        # evict down to 90% of the budget so we don't rescan on every render
+        target = self.max_bytes * 0.9
+
+        for _, file_size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= file_size
+
+        with self.lock:
+            self.total_bytes = total
+
+
+image_cache = ImageCache()
+
+
+def thumbnail_url(kind, id, image_link, size):
+    # the source hash makes the URL change whenever image_link does, which
+    # is what lets the proxy serve it with a year-long max-age
+    if not image_link:
+        return ""
+    version = hashlib.sha256(image_link.encode()).hexdigest()[:12]
+    return url_for("image", kind=kind, id=id, size=size, v=version)
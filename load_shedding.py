@@ -0,0 +1,123 @@
+import threading
+from collections import Counter
+
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+# ----------------------------------------------------------------------------#
+# Per-route query budgets and load shedding.
+#
+# Every endpoint belongs to a route class (ROUTE_CLASSES, falling back to
+# "pages"). Each class has a concurrency limit - requests over it get an
+# immediate 503 with Retry-After instead of queueing behind slow ones - and
+# a Postgres statement_timeout applied to every transaction the request
+# opens. Both come from ROUTE_LIMITS, so they can be tuned from a settings
+# file (FYYUR_SETTINGS) without code changes.
+# ----------------------------------------------------------------------------#
+
+DEFAULT_CLASS = "pages"
+EXEMPT_ENDPOINTS = {"static", "healthz", "readyz"}
+QUERY_CANCELED = "57014"
+
+
+class LoadShedder:
+    def __init__(self):
+        self.route_classes = {}
+        self.limits = {}
+        self.retry_after = 1
+        self.semaphores = {}
+        self.lock = threading.Lock()
+        self.shed = Counter()
+        self.timeouts = Counter()
+
+    def init_app(self, app):
+        self.route_classes = app.config["ROUTE_CLASSES"]
+        self.limits = app.config["ROUTE_LIMITS"]
+        self.retry_after = app.config["SHED_RETRY_AFTER"]
+        self.semaphores = {
+            route_class: threading.BoundedSemaphore(limit["concurrency"])
+            for route_class, limit in self.limits.items()
+        }
+
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+        app.register_error_handler(OperationalError, self.timed_out)
+
+    def route_class(self, endpoint):
+        return self.route_classes.get(endpoint, DEFAULT_CLASS)
+
+    def unavailable(self, error, route_class):
+        response = jsonify({"error": error, "route_class": route_class})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(self.retry_after)
+        return response
+
+    def admit(self):
+        if request.endpoint is None or request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+        route_class = self.route_class(request.endpoint)
+        limit = self.limits[route_class]
+
+        if not self.semaphores[route_class].acquire(blocking=False):
+            with self.lock:
+                self.shed[route_class] += 1
+            return self.unavailable("overloaded", route_class)
+
+        g.route_class = route_class
+        g.statement_timeout_ms = limit["statement_timeout_ms"]
+        return None
+
+    def release(self, exc=None):
+        route_class = g.pop("route_class", None)
+        if route_class is not None:
+            self.semaphores[route_class].release()
+
+    def timed_out(self, error):
+        # anything other than a statement timeout goes to the 500 handler
+        if sqlstate(error.orig) != QUERY_CANCELED:
+            raise error
+        return self.unavailable("timed out", g.get("route_class", DEFAULT_CLASS))
+
+    def count_timeout(self):
+        route_class = g.get("route_class", DEFAULT_CLASS)
+        with self.lock:
+            self.timeouts[route_class] += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                route_class: {
+                    "concurrency": limit["concurrency"],
+                    "statement_timeout_ms": limit["statement_timeout_ms"],
+                    "shed": self.shed[route_class],
+                    "timeouts": self.timeouts[route_class],
+                }
+                for route_class, limit in self.limits.items()
+            }
+
+
+def sqlstate(exception):
+    # psycopg2 exposes the SQLSTATE as pgcode, psycopg 3 as sqlstate
+    return getattr(exception, "sqlstate", None) or getattr(exception, "pgcode", None)
+
+
+load_shedder = LoadShedder()
+
+
+@event.listens_for(Session, "after_begin")
+def _set_statement_timeout(session, transaction, connection):
+    # SET LOCAL only lasts for this transaction, so pooled connections go
+    # back to the server default once the request's transaction ends
+    if has_request_context() and g.get("statement_timeout_ms"):
+        connection.execute(
+            text(f"SET LOCAL statement_timeout = {int(g.statement_timeout_ms)}")
+        )
+
+
+@event.listens_for(Engine, "handle_error")
+def _count_statement_timeouts(context):
+    if sqlstate(context.original_exception) == QUERY_CANCELED and has_request_context():
+        load_shedder.count_timeout()
@@ -0,0 +1,199 @@
+import numpy as np
+
+from models import db, Artist, Venue, Show, Match
+from recommendations import genre_matrix, jaccard
+
+TOP_K = 20
+BLOCK_SIZE = 256
+INSERT_BATCH = 10000
+
+GENRE_WEIGHT = 0.6
+SAME_STATE_WEIGHT = 0.1
+SAME_CITY_WEIGHT = 0.2
+HISTORY_WEIGHT = 0.1
+
+
+def location_codes(artist_places, venue_places):
+    # map (city, state) and state strings to shared integer codes so the
+    # comparisons below are integer broadcasts instead of string compares
+    places = [
+        (city.strip().lower(), state) for city, state in artist_places + venue_places
+    ]
+    _, city_codes = np.unique(
+        np.array([f"{city}|{state}" for city, state in places], dtype=object),
+        return_inverse=True,
+    )
+    _, state_codes = np.unique(
+        np.array([state for _, state in places], dtype=object), return_inverse=True
+    )
+    split = len(artist_places)
+    return (
+        (city_codes[:split], state_codes[:split]),
+        (city_codes[split:], state_codes[split:]),
+    )
+
+
+def score_pairs(artists, venues, history, k=TOP_K):
+    """Score every seeking artist against every seeking venue.
+
+    artists and venues are dicts of NumPy arrays (genres, city, state) and
+    history is a pair of (artist_index, venue_index) arrays of past shows.
+    The score matrix is built BLOCK_SIZE artists at a time; only the top k
+    venues per artist and top k artists per venue are kept, dropping pairs
+    that score nothing. Returns (artist_index, venue_index, score) arrays.
+    """
+    n_artists, n_venues = len(artists["genres"]), len(venues["genres"])
+    if n_artists == 0 or n_venues == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=np.float32)
+
+    history_artist, history_venue = history
+    history_order = np.argsort(history_artist, kind="stable")
+    history_artist = history_artist[history_order]
+    history_venue = history_venue[history_order]
+
+    artist_k = min(k, n_venues)
+    venue_k = min(k, n_artists)
+    out_artist, out_venue, out_score = [], [], []
+    # running best artists per venue, one column per venue
+    venue_best_scores = np.empty((0, n_venues), dtype=np.float32)
+    venue_best_index = np.empty((0, n_venues), dtype=np.int64)
+
+    for start in range(0, n_artists, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, n_artists)
+
+        scores = jaccard(artists["genres"][start:stop], venues["genres"])
+        scores *= np.float32(GENRE_WEIGHT)
+        scores += np.float32(SAME_STATE_WEIGHT) * (
+            artists["state"][start:stop, None] == venues["state"][None, :]
+        )
+        scores += np.float32(SAME_CITY_WEIGHT) * (
+            artists["city"][start:stop, None] == venues["city"][None, :]
+        )
+
+        lo, hi = np.searchsorted(history_artist, [start, stop])
+        scores[history_artist[lo:hi] - start, history_venue[lo:hi]] += np.float32(
+            HISTORY_WEIGHT
+        )
+
+        # best venues for each artist in the block
+        best = np.argpartition(scores, n_venues - artist_k, axis=1)[:, -artist_k:]
+        out_artist.append(np.repeat(np.arange(start, stop), artist_k))
+        out_venue.append(best.ravel())
+        out_score.append(np.take_along_axis(scores, best, axis=1).ravel())
+
+        # merge the block's best artists into the running best for each venue
+        block_k = min(venue_k, stop - start)
+        best = np.argpartition(scores, stop - start - block_k, axis=0)[-block_k:]
+        venue_best_scores = np.concatenate(
+            (venue_best_scores, np.take_along_axis(scores, best, axis=0))
+        )
+        venue_best_index = np.concatenate((venue_best_index, best + start))
+        if len(venue_best_scores) > venue_k:
+            best = np.argpartition(
+                venue_best_scores, len(venue_best_scores) - venue_k, axis=0
+            )[-venue_k:]
+            venue_best_scores = np.take_along_axis(venue_best_scores, best, axis=0)
+            venue_best_index = np.take_along_axis(venue_best_index, best, axis=0)
+
+    out_artist.append(venue_best_index.ravel())
+    out_venue.append(np.tile(np.arange(n_venues), len(venue_best_index)))
+    out_score.append(venue_best_scores.ravel())
+
+    artist_index = np.concatenate(out_artist)
+    venue_index = np.concatenate(out_venue)
+    score = np.concatenate(out_score)
+
+    # top k of a row with fewer than k matches is padded with zero scores
+    positive = score > 0
+    artist_index, venue_index, score = (
+        artist_index[positive],
+        venue_index[positive],
+        score[positive],
+    )
+
+    # a pair can be in both an artist's and a venue's top k
+    _, first = np.unique(artist_index * n_venues + venue_index, return_index=True)
+    return artist_index[first], venue_index[first], score[first]
+
+
+def rebuild_all(k=TOP_K):
+    """Recompute the Match table for all seeking artists and venues."""
+    artist_rows = (
+        db.session.query(Artist.id, Artist.genres, Artist.city, Artist.state)
+        .filter(Artist.seeking_venue.is_(True))
+        .order_by(Artist.id)
+        .all()
+    )
+    venue_rows = (
+        db.session.query(Venue.id, Venue.genres, Venue.city, Venue.state)
+        .filter(Venue.seeking_talent.is_(True))
+        .order_by(Venue.id)
+        .all()
+    )
+
+    artist_ids, artist_genres = genre_matrix([row[:2] for row in artist_rows])
+    venue_ids, venue_genres = genre_matrix([row[:2] for row in venue_rows])
+    (artist_city, artist_state), (venue_city, venue_state) = location_codes(
+        [row[2:] for row in artist_rows], [row[2:] for row in venue_rows]
+    )
+
+    shows = np.array(
+        db.session.query(Show.artist_id, Show.venue_id).distinct().all(),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    # translate show ids to positions, dropping pairs outside the seeking sets
+    artist_pos = np.searchsorted(artist_ids, shows[:, 0])
+    venue_pos = np.searchsorted(venue_ids, shows[:, 1])
+    known = (artist_pos < len(artist_ids)) & (venue_pos < len(venue_ids))
+    shows, artist_pos, venue_pos = shows[known], artist_pos[known], venue_pos[known]
+    known = (artist_ids[artist_pos] == shows[:, 0]) & (
+        venue_ids[venue_pos] == shows[:, 1]
+    )
+
+    artist_index, venue_index, score = score_pairs(
+        {"genres": artist_genres, "city": artist_city, "state": artist_state},
+        {"genres": venue_genres, "city": venue_city, "state": venue_state},
+        (artist_pos[known], venue_pos[known]),
+        k,
+    )
+
+    rows = [
+        {"artist_id": int(artist_ids[a]), "venue_id": int(venue_ids[v]), "score": float(s)}
+        for a, v, s in zip(artist_index, venue_index, score)
+    ]
+    db.session.query(Match).delete(synchronize_session=False)
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(Match.__table__.insert(), rows[start : start + INSERT_BATCH])
+    db.session.commit()
+    return len(rows)
+
+
+def matches_for_artist(artist_id, limit=TOP_K):
+    rows = (
+        db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Match.score)
+        .join(Match, Match.venue_id == Venue.id)
+        .filter(Match.artist_id == artist_id)
+        .order_by(Match.score.desc(), Venue.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {"id": id, "name": name, "city": city, "state": state, "score": score}
+        for id, name, city, state, score in rows
+    ]
+
+
+def matches_for_venue(venue_id, limit=TOP_K):
+    rows = (
+        db.session.query(Artist.id, Artist.name, Artist.city, Artist.state, Match.score)
+        .join(Match, Match.artist_id == Artist.id)
+        .filter(Match.venue_id == venue_id)
+        .order_by(Match.score.desc(), Artist.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {"id": id, "name": name, "city": city, "state": state, "score": score}
+        for id, name, city, state, score in rows
+    ]
@@ -0,0 +1,38 @@
+"""add updated_at to venue and artist
+
+Revision ID: 0f7b3c95e214
+Revises: a6d94e2b1c38
+Create Date: 2026-10-19 19:44:15.208733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import add_column_for_backfill, lock_timeout, register_backfill
+
+
+# revision identifiers, used by Alembic.
+revision = '0f7b3c95e214'
+down_revision = 'a6d94e2b1c38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows are stamped by `flask backfill run venue_updated_at`
+    # (and artist_updated_at); until then the sitemap omits their lastmod
+    with lock_timeout():
+        for table in ('Venue', 'Artist'):
+            add_column_for_backfill(
+                table,
+                sa.Column('updated_at', sa.DateTime(), nullable=True),
+                server_default=sa.text('now()'),
+            )
+    register_backfill('venue_updated_at', 'Venue', 'updated_at', 'now()')
+    register_backfill('artist_updated_at', 'Artist', 'updated_at', 'now()')
+
+
+def downgrade():
+    op.execute("DELETE FROM \"BackfillJob\" WHERE name IN ('venue_updated_at', 'artist_updated_at')")
+    op.drop_column('Artist', 'updated_at')
+    op.drop_column('Venue', 'updated_at')
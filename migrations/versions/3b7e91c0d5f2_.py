@@ -0,0 +1,26 @@
+"""add optimistic locking version to venue and artist
+
+Revision ID: 3b7e91c0d5f2
+Revises: 8c1d2e7f4a10
+Create Date: 2026-10-19 10:02:47.530112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e91c0d5f2'
+down_revision = '8c1d2e7f4a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version')
+    op.drop_column('Venue', 'version')
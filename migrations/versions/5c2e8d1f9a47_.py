@@ -0,0 +1,33 @@
+"""add show event outbox
+
+Revision ID: 5c2e8d1f9a47
+Revises: e3a0c7f58d26
+Create Date: 2026-10-19 17:02:41.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8d1f9a47'
+down_revision = 'e3a0c7f58d26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowEvent',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ShowEvent')
@@ -0,0 +1,33 @@
+"""add artist venue match table
+
+Revision ID: 71e5c3a9b804
+Revises: d4f08a6b2c91
+Create Date: 2026-10-19 12:41:19.062458
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '71e5c3a9b804'
+down_revision = 'd4f08a6b2c91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Match',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'venue_id')
+    )
+    op.create_index(op.f('ix_Match_venue_id'), 'Match', ['venue_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_Match_venue_id'), table_name='Match')
+    op.drop_table('Match')
@@ -0,0 +1,93 @@
+"""partition show by month of start_time
+
+Revision ID: a6d94e2b1c38
+Revises: 5c2e8d1f9a47
+Create Date: 2026-10-19 18:21:07.530912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d94e2b1c38'
+down_revision = '5c2e8d1f9a47'
+branch_labels = None
+depends_on = None
+
+# Rewrites the whole table and holds an exclusive lock on Show while it
+# runs - apply during a maintenance window. Later partitions are created by
+# `flask partitions ensure` (see partitions.py).
+
+
+def show_table(name, *constraints, **kw):
+    return op.create_table(name,
+    sa.Column('id', sa.Integer(), server_default=sa.text('nextval(\'"Show_id_seq"\'::regclass)'), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], name='Show_artist_id_fkey', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], name='Show_venue_id_fkey', ondelete='CASCADE'),
+    *constraints,
+    **kw
+    )
+
+
+def set_aside_old_table():
+    op.rename_table('Show', 'Show_old')
+    op.execute('ALTER TABLE "Show_old" RENAME CONSTRAINT "Show_pkey" TO "Show_old_pkey"')
+    op.execute('ALTER INDEX "ix_Show_venue_id" RENAME TO "ix_Show_old_venue_id"')
+    op.execute('ALTER INDEX "ix_Show_artist_id" RENAME TO "ix_Show_old_artist_id"')
+    # keep the id sequence alive when the old table is dropped
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+
+
+def move_rows_and_drop_old_table():
+    op.execute(
+        'INSERT INTO "Show" (id, start_time, created_at, venue_id, artist_id) '
+        'SELECT id, start_time, created_at, venue_id, artist_id FROM "Show_old"'
+    )
+    op.drop_table('Show_old')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.create_index(op.f('ix_Show_venue_id'), 'Show', ['venue_id'], unique=False)
+    op.create_index(op.f('ix_Show_artist_id'), 'Show', ['artist_id'], unique=False)
+
+
+def upgrade():
+    set_aside_old_table()
+    show_table('Show',
+        sa.PrimaryKeyConstraint('id', 'start_time'),
+        postgresql_partition_by='RANGE (start_time)',
+    )
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+    # a partition for every month that has shows and for the next three
+    op.execute('''
+        DO $$
+        DECLARE month date;
+        BEGIN
+            FOR month IN
+                SELECT date_trunc('month', start_time)::date FROM "Show_old"
+                UNION
+                SELECT generate_series(
+                    date_trunc('month', now()),
+                    date_trunc('month', now()) + interval '3 months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF "Show" FOR VALUES FROM (%L) TO (%L)',
+                    'Show_y' || to_char(month, 'YYYY"m"MM'),
+                    month,
+                    month + interval '1 month'
+                );
+            END LOOP;
+        END $$
+    ''')
+    move_rows_and_drop_old_table()
+
+
+def downgrade():
+    set_aside_old_table()
+    show_table('Show', sa.PrimaryKeyConstraint('id'))
+    move_rows_and_drop_old_table()
@@ -0,0 +1,34 @@
+"""add show created_at and show rollup table
+
+Revision ID: b92f6d13e7a8
+Revises: 71e5c3a9b804
+Create Date: 2026-10-19 14:05:52.316790
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b92f6d13e7a8'
+down_revision = '71e5c3a9b804'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.create_table('ShowRollup',
+    sa.Column('entity', sa.String(length=10), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('dimension', sa.String(length=10), nullable=False),
+    sa.Column('bucket', sa.String(length=120), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.Column('lead_time_seconds', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('entity', 'entity_id', 'dimension', 'bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('ShowRollup')
+    op.drop_column('Show', 'created_at')
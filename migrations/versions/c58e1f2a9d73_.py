@@ -0,0 +1,34 @@
+"""add archived show rollup table
+
+Revision ID: c58e1f2a9d73
+Revises: 0f7b3c95e214
+Create Date: 2026-10-19 21:12:40.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c58e1f2a9d73'
+down_revision = '0f7b3c95e214'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # months archived before this revision were already dropped from the
+    # rollups by reconcile and are not recovered here
+    op.create_table('ArchivedShowRollup',
+    sa.Column('entity', sa.String(length=10), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('dimension', sa.String(length=10), nullable=False),
+    sa.Column('bucket', sa.String(length=120), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.Column('lead_time_seconds', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('entity', 'entity_id', 'dimension', 'bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('ArchivedShowRollup')
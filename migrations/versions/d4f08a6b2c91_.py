@@ -0,0 +1,42 @@
+"""add similar artist and recommended venue tables
+
+Revision ID: d4f08a6b2c91
+Revises: 3b7e91c0d5f2
+Create Date: 2026-10-19 11:20:05.874319
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f08a6b2c91'
+down_revision = '3b7e91c0d5f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('SimilarArtist',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('similar_artist_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['similar_artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'similar_artist_id')
+    )
+    op.create_table('RecommendedVenue',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'venue_id')
+    )
+    op.create_index(op.f('ix_RecommendedVenue_venue_id'), 'RecommendedVenue', ['venue_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_RecommendedVenue_venue_id'), table_name='RecommendedVenue')
+    op.drop_table('RecommendedVenue')
+    op.drop_table('SimilarArtist')
@@ -0,0 +1,35 @@
+"""add backfill job table
+
+Revision ID: e3a0c7f58d26
+Revises: b92f6d13e7a8
+Create Date: 2026-10-19 15:33:08.442671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a0c7f58d26'
+down_revision = 'b92f6d13e7a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('BackfillJob',
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.Column('table', sa.String(length=120), nullable=False),
+    sa.Column('column', sa.String(length=120), nullable=False),
+    sa.Column('expression', sa.String(), nullable=False),
+    sa.Column('batch_size', sa.Integer(), nullable=False),
+    sa.Column('last_id', sa.BigInteger(), nullable=False),
+    sa.Column('rows_updated', sa.BigInteger(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('BackfillJob')
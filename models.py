@@ -1,4 +1,6 @@
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
 
 db = SQLAlchemy()
 
@@ -18,7 +20,17 @@ class Venue(db.Model):
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship("Show", backref="venue", lazy=True)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+    # lastmod in the sitemaps; NULL until backfilled on rows that predate it
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.now,
+        onupdate=datetime.now,
+        server_default=db.func.now(),
+    )
+    shows = db.relationship("Show", backref="venue", lazy=True, passive_deletes=True)
+
+    __mapper_args__ = {"version_id_col": version}
 
     def __repr__(self):
         venue = "Venue(" + self.id + "," + str(self.name) + ")"
@@ -39,13 +51,156 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
-    shows = db.relationship("Show", backref="artist", lazy=True)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+    # lastmod in the sitemaps; NULL until backfilled on rows that predate it
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.now,
+        onupdate=datetime.now,
+        server_default=db.func.now(),
+    )
+    shows = db.relationship("Show", backref="artist", lazy=True, passive_deletes=True)
+
+    __mapper_args__ = {"version_id_col": version}
 
 
 class Show(db.Model):
     __tablename__ = "Show"
+    # monthly range partitions, managed by partitions.py; the partition key
+    # has to be part of the primary key
+    __table_args__ = {"postgresql_partition_by": "RANGE (start_time)"}
 
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    start_time = db.Column(db.DateTime, primary_key=True)
+    created_at = db.Column(
+        db.DateTime, nullable=False, default=datetime.now, server_default=db.func.now()
+    )
+    venue_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Venue.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    artist_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Artist.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+
+# shows for months without a partition yet land here until
+# `flask partitions ensure` moves them out
+event.listen(
+    Show.__table__,
+    "after_create",
+    DDL('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT'),
+)
+
+
+class SimilarArtist(db.Model):
+    __tablename__ = "SimilarArtist"
+
+    artist_id = db.Column(
+        db.Integer, db.ForeignKey("Artist.id", ondelete="CASCADE"), primary_key=True
+    )
+    similar_artist_id = db.Column(
+        db.Integer, db.ForeignKey("Artist.id", ondelete="CASCADE"), primary_key=True
+    )
+    score = db.Column(db.Float, nullable=False)
+
+
+class RecommendedVenue(db.Model):
+    __tablename__ = "RecommendedVenue"
+
+    artist_id = db.Column(
+        db.Integer, db.ForeignKey("Artist.id", ondelete="CASCADE"), primary_key=True
+    )
+    venue_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Venue.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    score = db.Column(db.Float, nullable=False)
+
+
+class Match(db.Model):
+    __tablename__ = "Match"
+
+    artist_id = db.Column(
+        db.Integer, db.ForeignKey("Artist.id", ondelete="CASCADE"), primary_key=True
+    )
+    venue_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Venue.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    score = db.Column(db.Float, nullable=False)
+
+
+class ShowRollup(db.Model):
+    __tablename__ = "ShowRollup"
+
+    # entity is 'venue' or 'artist'; dimension is 'day', 'month', 'weekday'
+    # or 'genre' - see analytics.py for the bucket formats
+    entity = db.Column(db.String(10), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    dimension = db.Column(db.String(10), primary_key=True)
+    bucket = db.Column(db.String(120), primary_key=True)
+    shows = db.Column(db.Integer, nullable=False, default=0)
+    lead_time_seconds = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class ArchivedShowRollup(db.Model):
+    __tablename__ = "ArchivedShowRollup"
+
+    # what the archived Show partitions added to ShowRollup, so reconcile()
+    # can keep counting them once their rows are gone
+    entity = db.Column(db.String(10), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    dimension = db.Column(db.String(10), primary_key=True)
+    bucket = db.Column(db.String(120), primary_key=True)
+    shows = db.Column(db.Integer, nullable=False, default=0)
+    lead_time_seconds = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class BackfillJob(db.Model):
+    __tablename__ = "BackfillJob"
+
+    name = db.Column(db.String(120), primary_key=True)
+    table = db.Column(db.String(120), nullable=False)
+    column = db.Column(db.String(120), nullable=False)
+    expression = db.Column(db.String, nullable=False)
+    batch_size = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.BigInteger, nullable=False, default=0)
+    rows_updated = db.Column(db.BigInteger, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+class ShowEvent(db.Model):
+    __tablename__ = "ShowEvent"
+
+    # transactional outbox for the live show feed (see show_feed.py); rows
+    # are written with the change they describe and keep no foreign keys so
+    # they outlive deleted shows
+    id = db.Column(db.BigInteger, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    show_id = db.Column(db.Integer, nullable=False)
+    venue_id = db.Column(db.Integer, nullable=False)
+    artist_id = db.Column(db.Integer, nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id"), nullable=False)
+    # set by the database only, so it and prune() share one clock
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+def apply_changes(record, values):
+    # only assign attributes whose value actually differs so the UPDATE
+    # lists just those columns (and no UPDATE is issued when nothing changed)
+    changed = []
+    for key, value in values.items():
+        if getattr(record, key) != value:
+            setattr(record, key, value)
+            changed.append(key)
+    return changed
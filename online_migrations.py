@@ -0,0 +1,243 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import click
+from alembic import op
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from models import db, BackfillJob
+
+# ----------------------------------------------------------------------------#
+# Zero-downtime migration helpers.
+#
+# Use these from Alembic revisions instead of the raw op.* calls when the
+# table is large:
+#
+#   def upgrade():
+#       with lock_timeout():
+#           add_column_for_backfill("Show", sa.Column("ends_at", sa.DateTime()))
+#       register_backfill("show_ends_at", "Show", "ends_at",
+#                         "start_time + interval '3 hours'")
+#       create_index_concurrently("ix_Show_ends_at", "Show", ["ends_at"])
+#
+# then run `flask backfill run show_ends_at` and, once it is done, a later
+# revision can make the column NOT NULL.
+# ----------------------------------------------------------------------------#
+
+DEFAULT_LOCK_TIMEOUT = "5s"
+DEFAULT_BATCH_SIZE = 5000
+
+
+@contextmanager
+def lock_timeout(timeout=DEFAULT_LOCK_TIMEOUT, statement_timeout="60s"):
+    # DDL queues behind (and in front of) every other lock on the table;
+    # fail fast instead of stalling traffic, and retry the deploy later
+    op.execute(f"SET LOCAL lock_timeout = '{timeout}'")
+    op.execute(f"SET LOCAL statement_timeout = '{statement_timeout}'")
+    yield
+    op.execute("SET LOCAL lock_timeout = DEFAULT")
+    op.execute("SET LOCAL statement_timeout = DEFAULT")
+
+
+def index_is_valid(name):
+    """True or False for an existing index, None when there is none."""
+    return (
+        op.get_bind()
+        .execute(
+            text(
+                "SELECT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass(:name)"
+            ),
+            {"name": f'"{name}"'},
+        )
+        .scalar()
+    )
+
+
+def create_index_concurrently(name, table, columns, **kw):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        # the SET outlives this call on the session, error or not
+        op.execute(f"SET lock_timeout = '{DEFAULT_LOCK_TIMEOUT}'")
+        try:
+            # a build that failed part way (a lock timeout, a duplicate for a
+            # unique index) leaves an INVALID index that IF NOT EXISTS would
+            # take for a finished one
+            if index_is_valid(name) is False:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+                **kw,
+            )
+        finally:
+            op.execute("SET lock_timeout = DEFAULT")
+
+
+def drop_index_concurrently(name, table):
+    with op.get_context().autocommit_block():
+        op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def add_column_for_backfill(table, column, server_default=None):
+    """Add a column without rewriting the table.
+
+    The column is added nullable with no default (a catalog-only change);
+    the default, if any, is set afterwards so it only applies to new rows.
+    Existing rows are filled in by a backfill job.
+    """
+    column.nullable = True
+    op.add_column(table, column)
+    if server_default is not None:
+        op.alter_column(table, column.name, server_default=server_default)
+
+
+def register_backfill(name, table, column, expression, batch_size=DEFAULT_BATCH_SIZE):
+    # the job row is created in the migration's transaction, the work itself
+    # happens later in throttled batches via `flask backfill run`
+    op.bulk_insert(
+        BackfillJob.__table__,
+        [
+            {
+                "name": name,
+                "table": table,
+                "column": column,
+                "expression": expression,
+                "batch_size": batch_size,
+                "last_id": 0,
+                "rows_updated": 0,
+                "status": "pending",
+                "updated_at": datetime.now(),
+            }
+        ],
+    )
+
+
+# ----------------------------------------------------------------------------#
+# Backfill runner.
+# ----------------------------------------------------------------------------#
+
+
+@contextmanager
+def backfill_lock(name):
+    """Hold a session advisory lock on the job for the whole run.
+
+    Two runs of one job would update the same ranges and overwrite each
+    other's progress; the second one fails here instead.
+    """
+    with db.engine.connect() as connection:
+        key = {"name": f"backfill:{name}"}
+        locked = connection.execute(
+            text("SELECT pg_try_advisory_lock(hashtext(:name))"), key
+        ).scalar()
+        connection.commit()
+        if not locked:
+            raise click.ClickException(f"backfill {name} is already running")
+        try:
+            yield
+        finally:
+            # session locks outlive the transaction, and the connection
+            # goes back to the pool
+            connection.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), key)
+            connection.commit()
+
+
+def run_backfill(name, sleep=0.1, max_batches=None, echo=print):
+    """Run (or resume) a registered backfill.
+
+    Each batch updates one primary key range where the column is still
+    NULL and records its progress in the same transaction, so a killed
+    run resumes from the last committed batch. Only one run of a job can
+    be in progress at a time.
+    """
+    with backfill_lock(name):
+        _run_backfill(name, sleep, max_batches, echo)
+
+
+def _run_backfill(name, sleep, max_batches, echo):
+    engine = db.engine
+    with engine.connect() as connection:
+        job = connection.execute(
+            BackfillJob.__table__.select().where(BackfillJob.name == name)
+        ).first()
+        if job is None:
+            raise click.ClickException(f"no backfill named {name}")
+        max_id = connection.execute(
+            text(f'SELECT coalesce(max(id), 0) FROM "{job.table}"')
+        ).scalar()
+
+    last_id = job.last_id
+    batches = 0
+    while last_id < max_id:
+        if max_batches is not None and batches >= max_batches:
+            break
+        upper = last_id + job.batch_size
+
+        with engine.begin() as connection:
+            connection.execute(text("SET LOCAL lock_timeout = '2s'"))
+            updated = connection.execute(
+                text(
+                    f'UPDATE "{job.table}" SET "{job.column}" = {job.expression} '
+                    f'WHERE id > :lower AND id <= :upper AND "{job.column}" IS NULL'
+                ),
+                {"lower": last_id, "upper": upper},
+            ).rowcount
+            connection.execute(
+                BackfillJob.__table__.update()
+                .where(BackfillJob.name == name)
+                .values(
+                    last_id=upper,
+                    rows_updated=BackfillJob.rows_updated + updated,
+                    status="running",
+                    updated_at=datetime.now(),
+                )
+            )
+
+        last_id = upper
+        batches += 1
+        echo(f"{name}: ids <= {min(upper, max_id)} of {max_id} ({updated} rows)")
+        time.sleep(sleep)
+
+    if last_id >= max_id:
+        with engine.begin() as connection:
+            connection.execute(
+                BackfillJob.__table__.update()
+                .where(BackfillJob.name == name)
+                .values(status="done", updated_at=datetime.now())
+            )
+        echo(f"{name}: done")
+
+
+backfill_cli = AppGroup("backfill", help="Run and monitor batched backfills.")
+
+
+@backfill_cli.command("run")
+@click.argument("name")
+@click.option("--sleep", default=0.1, help="Seconds to pause between batches.")
+@click.option("--max-batches", type=int, default=None, help="Stop after N batches.")
+def run_command(name, sleep, max_batches):
+    run_backfill(name, sleep=sleep, max_batches=max_batches)
+
+
+@backfill_cli.command("status")
+def status_command():
+    for job in BackfillJob.query.order_by(BackfillJob.name):
+        click.echo(
+            f"{job.name}: {job.status}, {job.rows_updated} rows, "
+            f"last id {job.last_id}, updated {job.updated_at:%Y-%m-%d %H:%M:%S}"
+        )
+
+
+@backfill_cli.command("reset")
+@click.argument("name")
+def reset_command(name):
+    BackfillJob.query.filter_by(name=name).update(
+        {"last_id": 0, "status": "pending", "updated_at": datetime.now()}
+    )
+    db.session.commit()
+    click.echo(f"{name}: reset")
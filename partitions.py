@@ -0,0 +1,239 @@
+import csv
+import gzip
+import os
+import re
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+import analytics
+from models import db, Show
+
+# ----------------------------------------------------------------------------#
+# Monthly partitions of Show.
+#
+# Show is range partitioned on start_time, one partition per calendar month
+# named Show_yYYYYmMM, plus Show_default for anything no partition covers
+# yet. Run `flask partitions ensure` daily (cron) to keep the coming months
+# created ahead of time; rows that already landed in the default partition
+# are moved into the new partition as it is attached.
+#
+# `flask partitions archive --before YYYY-MM` detaches the months before
+# that one, writes each to a gzipped CSV in SHOW_ARCHIVE_DIR and drops it.
+# Archived shows are gone from the pages but stay counted in the show
+# rollups: their aggregates move to ArchivedShowRollup as the partition is
+# dropped, and `flask reconcile-stats` adds them to what Show still holds.
+# A month whose archive failed after the detach is left as a detached
+# Show_yYYYYmMM table; the next archive run finishes it first.
+# ----------------------------------------------------------------------------#
+
+DEFAULT_PARTITION = "Show_default"
+PARTITION_NAME = re.compile(r"^Show_y(\d{4})m(\d{2})$")
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def history_start(months=None):
+    """Start of the oldest month shown on the pages (SHOW_HISTORY_MONTHS).
+
+    Filtering on it lets Postgres skip the partitions before it.
+    """
+    if months is None:
+        months = current_app.config["SHOW_HISTORY_MONTHS"]
+    start = add_months(month_start(datetime.now()), -months)
+    return datetime(start.year, start.month, 1)
+
+
+def partition_name(month):
+    return f"Show_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name):
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partition(table_name):
+    return table_name == DEFAULT_PARTITION or partition_month(table_name) is not None
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Alembic hook: leave the partitions and their indexes out of autogenerate.
+
+    They are made by `flask partitions ensure`, not by the models, so
+    autogenerate would otherwise emit drops for them.
+    """
+    if type_ == "table":
+        return not is_partition(name)
+    table = getattr(object, "table", None)
+    return table is None or not is_partition(table.name)
+
+
+def partitions(connection):
+    """Names of the attached monthly partitions, oldest first."""
+    names = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = 'Show'"
+        )
+    ).scalars()
+    return sorted(name for name in names if partition_month(name) is not None)
+
+
+def detached_partitions(connection):
+    """Names of Show_yYYYYmMM tables no longer attached to Show, oldest first.
+
+    These are months an earlier archive run detached but did not finish.
+    """
+    names = connection.execute(
+        text(
+            "SELECT relname FROM pg_class "
+            "WHERE relkind = 'r' AND NOT relispartition AND pg_table_is_visible(oid)"
+        )
+    ).scalars()
+    return sorted(name for name in names if partition_month(name) is not None)
+
+
+def create_partition(connection, month):
+    """Create and attach the partition for month, moving its rows out of
+    the default partition. Does nothing if it already exists."""
+    name = partition_name(month)
+    if name in partitions(connection):
+        return False
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+
+    # ATTACH refuses while the default partition still holds rows for the
+    # range, so build the table outside the parent, move them, then attach
+    connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+    connection.execute(
+        text(f'CREATE TABLE "{name}" (LIKE "Show" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    )
+    connection.execute(
+        text(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+            f"WHERE start_time >= :lower AND start_time < :upper RETURNING *) "
+            f'INSERT INTO "{name}" SELECT * FROM moved'
+        ),
+        {"lower": lower, "upper": upper},
+    )
+    connection.execute(
+        text(
+            f'ALTER TABLE "Show" ATTACH PARTITION "{name}" '
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+    )
+    return True
+
+
+def ensure_partitions(months_ahead=None, months_behind=0):
+    """Create the partitions from months_behind before this month to
+    months_ahead after it, and for any month that has rows in the default
+    partition. Returns the names of the partitions created."""
+    if months_ahead is None:
+        months_ahead = current_app.config["SHOW_PARTITIONS_AHEAD"]
+    this_month = month_start(datetime.now())
+    with db.engine.connect() as connection:
+        strays = connection.execute(
+            text(
+                f"SELECT DISTINCT date_trunc('month', start_time)::date "
+                f'FROM "{DEFAULT_PARTITION}"'
+            )
+        ).scalars()
+        months = {add_months(this_month, i) for i in range(-months_behind, months_ahead + 1)}
+        months.update(strays)
+
+    created = []
+    for month in sorted(months):
+        # one transaction per partition keeps each lock short
+        with db.engine.begin() as connection:
+            if create_partition(connection, month):
+                created.append(partition_name(month))
+    return created
+
+
+def archive_partition(name, directory):
+    """Detach one monthly partition, write it to a gzipped CSV and drop it.
+
+    Every step after the detach can be repeated, so a partition that is
+    already detached is picked up where an earlier run stopped.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    columns = [column.name for column in Show.__table__.columns]
+
+    with db.engine.begin() as connection:
+        if name in partitions(connection):
+            connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+            connection.execute(text(f'ALTER TABLE "Show" DETACH PARTITION "{name}"'))
+
+    # the detached table is invisible to the app, so it can be read at
+    # leisure; stream it with a server-side cursor instead of loading it
+    with db.engine.connect() as connection:
+        rows = connection.execution_options(stream_results=True, yield_per=5000).execute(
+            text(f'SELECT {", ".join(columns)} FROM "{name}" ORDER BY start_time, id')
+        )
+        partial = path + ".partial"
+        count = 0
+        with gzip.open(partial, "wt", newline="") as archive:
+            writer = csv.writer(archive)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        os.replace(partial, path)
+
+    with db.engine.begin() as connection:
+        analytics.archive_rollups(connection, name)
+        connection.execute(text(f'DROP TABLE "{name}"'))
+    return path, count
+
+
+def archive_partitions(before, directory=None):
+    directory = directory or current_app.config["SHOW_ARCHIVE_DIR"]
+    with db.engine.connect() as connection:
+        # finish what an earlier run left detached before starting on more
+        names = detached_partitions(connection) + [
+            name for name in partitions(connection) if partition_month(name) < before
+        ]
+    return [archive_partition(name, directory) for name in names]
+
+
+partitions_cli = AppGroup("partitions", help="Manage the monthly Show partitions.")
+
+
+@partitions_cli.command("ensure")
+@click.option("--ahead", type=int, default=None, help="Months to create ahead.")
+def ensure_command(ahead):
+    created = ensure_partitions(ahead)
+    click.echo(f"created {', '.join(created)}" if created else "nothing to create")
+
+
+@partitions_cli.command("list")
+def list_command():
+    with db.engine.connect() as connection:
+        for name in partitions(connection) + [DEFAULT_PARTITION]:
+            count = connection.execute(text(f'SELECT count(*) FROM "{name}"')).scalar()
+            click.echo(f"{name}: {count} shows")
+
+
+@partitions_cli.command("archive")
+@click.option("--before", required=True, help="First month to keep, as YYYY-MM.")
+@click.option("--directory", default=None, help="Defaults to SHOW_ARCHIVE_DIR.")
+def archive_command(before, directory):
+    keep_from = datetime.strptime(before, "%Y-%m").date()
+    if keep_from > month_start(datetime.now()):
+        raise click.ClickException("refusing to archive the current or future months")
+    for path, count in archive_partitions(keep_from, directory):
+        click.echo(f"{path}: {count} shows")
@@ -0,0 +1,229 @@
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ----------------------------------------------------------------------------#
+# On-demand request profiling.
+#
+# A request is profiled when it carries X-Profile with PROFILE_TOKEN, or at
+# random at PROFILE_SAMPLE_RATE. A sampler thread then records the request
+# thread's stack every PROFILE_INTERVAL seconds, and the SQL it runs is
+# timed. When the request finishes two files are written to PROFILE_DIR:
+#
+#   <name>.speedscope.json  open in https://www.speedscope.app
+#   <name>.summary.json     top functions by self and total time, and SQL
+#
+# and the response gets an X-Profile header with <name>. Requests that are
+# not profiled pay for one header lookup (and a random() call if sampling).
+# ----------------------------------------------------------------------------#
+
+HEADER = "X-Profile"
+TOP_FUNCTIONS = 30
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.frames = []
+        self.frame_ids = {}
+        self.samples = []
+        self.weights = []
+
+    def frame_id(self, code):
+        key = (code.co_filename, code.co_firstlineno, code.co_name)
+        id = self.frame_ids.get(key)
+        if id is None:
+            id = self.frame_ids[key] = len(self.frames)
+            self.frames.append(
+                {
+                    "name": getattr(code, "co_qualname", code.co_name),
+                    "file": code.co_filename,
+                    "line": code.co_firstlineno,
+                }
+            )
+        return id
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(now - last)
+            last = now
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Profiler:
+    def __init__(self):
+        self.token = ""
+        self.sample_rate = 0
+        self.interval = 0.001
+        self.directory = None
+        self.keep = 0
+
+    def init_app(self, app):
+        self.token = app.config["PROFILE_TOKEN"]
+        self.sample_rate = app.config["PROFILE_SAMPLE_RATE"]
+        self.interval = app.config["PROFILE_INTERVAL"]
+        self.directory = app.config["PROFILE_DIR"]
+        self.keep = app.config["PROFILE_KEEP"]
+        self.logger = app.logger
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.abandon)
+
+    def wanted(self):
+        token = request.headers.get(HEADER)
+        if token is not None and self.token:
+            # compare_digest refuses non-ASCII str, so compare the bytes
+            return hmac.compare_digest(
+                token.encode("utf-8", "surrogateescape"), self.token.encode("utf-8")
+            )
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        if not self.wanted():
+            return
+        g.profile_sql = []
+        g.profile_started = time.perf_counter()
+        g.profile_sampler = Sampler(threading.get_ident(), self.interval)
+        g.profile_sampler.start()
+
+    def finish(self, response):
+        sampler = g.pop("profile_sampler", None)
+        if sampler is None:
+            return response
+        sampler.stop()
+        elapsed = time.perf_counter() - g.profile_started
+        name = f"{datetime.now():%Y%m%d-%H%M%S}-{request.endpoint}-{os.getpid()}-{sampler.ident}"
+        try:
+            self.write(name, sampler, elapsed, g.pop("profile_sql"))
+            response.headers[HEADER] = name
+        except OSError:
+            self.logger.exception("Profile could not be written")
+        return response
+
+    def abandon(self, exc=None):
+        # the request failed before after_request ran
+        sampler = g.pop("profile_sampler", None)
+        if sampler is not None:
+            sampler.stop()
+
+    def write(self, name, sampler, elapsed, statements):
+        os.makedirs(self.directory, exist_ok=True)
+        title = f"{request.method} {request.full_path.rstrip('?')}"
+        speedscope = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": title,
+            "exporter": "fyyur",
+            "shared": {"frames": sampler.frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": title,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(sampler.weights),
+                    "samples": sampler.samples,
+                    "weights": sampler.weights,
+                }
+            ],
+        }
+        summary = {
+            "request": title,
+            "endpoint": request.endpoint,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "samples": len(sampler.samples),
+            **top_functions(sampler),
+            "sql": sql_summary(statements),
+        }
+        base = os.path.join(self.directory, name)
+        with open(base + ".speedscope.json", "w") as f:
+            json.dump(speedscope, f)
+        with open(base + ".summary.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        self.prune()
+
+    def prune(self):
+        # PROFILE_KEEP most recent profiles (two files each)
+        names = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in names[: max(0, len(names) - self.keep * 2)]:
+            os.unlink(entry.path)
+
+
+def top_functions(sampler):
+    self_time = Counter()
+    total_time = Counter()
+    for stack, weight in zip(sampler.samples, sampler.weights):
+        self_time[stack[-1]] += weight
+        # recursion counts once per sample
+        for id in set(stack):
+            total_time[id] += weight
+
+    def describe(counter):
+        return [
+            {
+                "function": sampler.frames[id]["name"],
+                "file": sampler.frames[id]["file"],
+                "line": sampler.frames[id]["line"],
+                "ms": round(seconds * 1000, 2),
+            }
+            for id, seconds in counter.most_common(TOP_FUNCTIONS)
+        ]
+
+    return {"self": describe(self_time), "total": describe(total_time)}
+
+
+def sql_summary(statements):
+    grouped = defaultdict(lambda: [0, 0.0])
+    for statement, seconds in statements:
+        grouped[statement][0] += 1
+        grouped[statement][1] += seconds
+    return sorted(
+        (
+            {"statement": statement, "count": count, "ms": round(seconds * 1000, 2)}
+            for statement, (count, seconds) in grouped.items()
+        ),
+        key=lambda entry: entry["ms"],
+        reverse=True,
+    )
+
+
+profiler = Profiler()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _profile_statement(conn, cursor, statement, parameters, context, executemany):
+    # query_start is set by request_logging's before_cursor_execute
+    if has_request_context() and "profile_sql" in g:
+        started = getattr(context, "query_start", None)
+        if started is not None:
+            g.profile_sql.append((statement, time.perf_counter() - started))
@@ -0,0 +1,366 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sqlalchemy import func
+
+from forms import genre_choices
+from models import db, Artist, Venue, SimilarArtist, RecommendedVenue
+
+# ----------------------------------------------------------------------------#
+# Genre vectors.
+# ----------------------------------------------------------------------------#
+
+GENRES = [value for value, label in genre_choices]
+GENRE_INDEX = {genre: i for i, genre in enumerate(GENRES)}
+GENRE_WEIGHTS = 1 << np.arange(len(GENRES), dtype=np.int64)
+
+TOP_K = 10
+BLOCK_SIZE = 1024
+INSERT_BATCH = 10000
+
+
+def genre_bits(genres):
+    bits = np.zeros(len(GENRES), dtype=np.float32)
+    for genre in genres or []:
+        if genre in GENRE_INDEX:
+            bits[GENRE_INDEX[genre]] = 1
+    return bits
+
+
+def genre_matrix(rows):
+    # rows are (id, genres) tuples, returns (ids, N x len(GENRES) matrix)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    matrix = np.zeros((len(rows), len(GENRES)), dtype=np.float32)
+    for i, (_, genres) in enumerate(rows):
+        for genre in genres or []:
+            if genre in GENRE_INDEX:
+                matrix[i, GENRE_INDEX[genre]] = 1
+    return ids, matrix
+
+
+def jaccard(a, b):
+    # a is (n, G), b is (m, G); both 0/1 matrices
+    intersection = a @ b.T
+    union = a.sum(axis=1)[:, None] + b.sum(axis=1)[None, :] - intersection
+    return np.divide(
+        intersection, union, out=np.zeros_like(intersection), where=union > 0
+    )
+
+
+# ----------------------------------------------------------------------------#
+# Top-k neighbours.
+# ----------------------------------------------------------------------------#
+
+
+def firsts_of(lengths):
+    # start of each run when runs of these lengths are laid end to end
+    return np.cumsum(lengths) - lengths
+
+
+def offsets_within(lengths):
+    # 0..length-1 for each run, concatenated
+    return np.arange(lengths.sum()) - np.repeat(firsts_of(lengths), lengths)
+
+
+def top_k_neighbours(query, target, k=TOP_K, exclude_self=False):
+    """Top-k most similar target rows for every query row.
+
+    With a 19 genre vocabulary most entities share a genre set with many
+    others, so the similarity is computed between the distinct genre sets
+    of each side (in blocks of BLOCK_SIZE query sets) and expanded back to
+    the entities afterwards. Returns (query_index, target_index, score)
+    arrays, best first for each query row.
+    """
+    query_masks = (query.astype(np.int64) * GENRE_WEIGHTS).sum(axis=1)
+    target_masks = (target.astype(np.int64) * GENRE_WEIGHTS).sum(axis=1)
+
+    query_sets, query_inverse = np.unique(query_masks, return_inverse=True)
+    target_sets, target_inverse, target_counts = np.unique(
+        target_masks, return_inverse=True, return_counts=True
+    )
+    query_inverse = query_inverse.ravel()
+    target_inverse = target_inverse.ravel()
+    query_set_bits = query[np.unique(query_inverse, return_index=True)[1]]
+    target_set_bits = target[np.unique(target_inverse, return_index=True)[1]]
+
+    # target entities grouped by genre set
+    target_members = np.argsort(target_inverse, kind="stable")
+    target_offsets = np.concatenate(([0], np.cumsum(target_counts)))
+
+    # every set holds at least one entity, so the best `needed` sets always
+    # hold the best `needed` entities
+    needed = k + 1 if exclude_self else k
+    width = min(needed, len(target_sets))
+
+    set_rows, set_candidates, set_scores = [], [], []
+    for start in range(0, len(query_sets), BLOCK_SIZE):
+        scores = jaccard(query_set_bits[start : start + BLOCK_SIZE], target_set_bits)
+        if width < scores.shape[1]:
+            top = np.argpartition(-scores, width - 1, axis=1)[:, :width]
+        else:
+            top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.lexsort((top, -top_scores), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        # how many members of each chosen set are needed to reach `needed`
+        counts = target_counts[top]
+        before = np.cumsum(counts, axis=1) - counts
+        take = np.clip(needed - before, 0, counts) * (top_scores > 0)
+
+        flat_take = take.ravel()
+        sets = np.repeat(top.ravel(), flat_take)
+        set_rows.append(np.repeat(start + np.arange(len(top)), take.sum(axis=1)))
+        members = target_offsets[sets] + offsets_within(flat_take)
+        set_candidates.append(target_members[members])
+        set_scores.append(np.repeat(top_scores.ravel(), flat_take))
+
+    if not set_rows or not sum(len(rows) for rows in set_rows):
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=np.float32)
+    set_rows = np.concatenate(set_rows)
+    set_candidates = np.concatenate(set_candidates)
+    set_scores = np.concatenate(set_scores)
+
+    # every entity sharing a genre set gets that set's candidate list
+    per_set = np.bincount(set_rows, minlength=len(query_sets))
+    set_starts = np.concatenate(([0], np.cumsum(per_set)))
+    lengths = per_set[query_inverse]
+    out_query = np.repeat(np.arange(len(query_inverse)), lengths)
+    picks = np.repeat(set_starts[query_inverse], lengths) + offsets_within(lengths)
+    out_target = set_candidates[picks]
+    out_score = set_scores[picks]
+
+    # minus itself when query and target are the same entities, then cap at k
+    keep = out_target != out_query if exclude_self else np.ones(len(out_query), bool)
+    kept = np.concatenate(([0], np.cumsum(keep)))
+    rank = kept[1:] - np.repeat(kept[firsts_of(lengths)], lengths)
+    keep &= rank <= k
+    return out_query[keep], out_target[keep], out_score[keep]
+
+
+# ----------------------------------------------------------------------------#
+# Storage.
+# ----------------------------------------------------------------------------#
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(table.insert(), rows[start : start + INSERT_BATCH])
+
+
+def _rows(key, key_ids, other, other_ids, query, target, score):
+    return [
+        {key: int(key_ids[q]), other: int(other_ids[t]), "score": float(s)}
+        for q, t, s in zip(query, target, score)
+    ]
+
+
+def rebuild_all(k=TOP_K):
+    """Recompute similar artists and recommended venues for every artist."""
+    artist_ids, artists = genre_matrix(db.session.query(Artist.id, Artist.genres).all())
+    venue_ids, venues = genre_matrix(db.session.query(Venue.id, Venue.genres).all())
+
+    similar = _rows(
+        "artist_id",
+        artist_ids,
+        "similar_artist_id",
+        artist_ids,
+        *top_k_neighbours(artists, artists, k, exclude_self=True),
+    )
+    recommended = _rows(
+        "artist_id",
+        artist_ids,
+        "venue_id",
+        venue_ids,
+        *top_k_neighbours(artists, venues, k),
+    )
+
+    db.session.query(SimilarArtist).delete(synchronize_session=False)
+    db.session.query(RecommendedVenue).delete(synchronize_session=False)
+    _insert(SimilarArtist.__table__, similar)
+    _insert(RecommendedVenue.__table__, recommended)
+    db.session.commit()
+    return len(similar), len(recommended)
+
+
+def update_artist(artist, k=TOP_K):
+    """Incremental refresh after an artist is created or its genres change.
+
+    Only artists and venues sharing a genre with it can score above zero,
+    so only those are loaded. Recomputes the artist's own lists and enters
+    it into the lists of the artists it now beats the kth entry of; lists it
+    drops out of entirely are one short until the next rebuild_all().
+    """
+    overlapping = (
+        db.session.query(
+            Artist.id,
+            Artist.genres,
+            func.count(SimilarArtist.similar_artist_id),
+            func.min(SimilarArtist.score),
+        )
+        .outerjoin(
+            SimilarArtist,
+            (SimilarArtist.artist_id == Artist.id)
+            & (SimilarArtist.similar_artist_id != artist.id),
+        )
+        .filter(Artist.genres.op("&&")(artist.genres), Artist.id != artist.id)
+        .group_by(Artist.id)
+        .all()
+    )
+    artist_ids, artists = genre_matrix([row[:2] for row in overlapping])
+    venue_ids, venues = genre_matrix(
+        db.session.query(Venue.id, Venue.genres)
+        .filter(Venue.genres.op("&&")(artist.genres))
+        .all()
+    )
+    query = genre_bits(artist.genres)[None, :]
+    own_id = np.array([artist.id])
+
+    similar = _rows(
+        "artist_id",
+        own_id,
+        "similar_artist_id",
+        artist_ids,
+        *top_k_neighbours(query, artists, k),
+    )
+    recommended = _rows(
+        "artist_id", own_id, "venue_id", venue_ids, *top_k_neighbours(query, venues, k)
+    )
+
+    # the other artists' lists, minus their old row for this artist
+    scores = jaccard(artists, query)[:, 0]
+    counts = np.array([count for _, _, count, _ in overlapping], dtype=np.int64)
+    kth = np.array([low or 0 for _, _, _, low in overlapping], dtype=np.float32)
+    enters = (scores > 0) & ((counts < k) | (scores > kth))
+    referring = [
+        {"artist_id": int(a), "similar_artist_id": artist.id, "score": float(s)}
+        for a, s in zip(artist_ids[enters], scores[enters])
+    ]
+    full = [int(a) for a in artist_ids[enters & (counts >= k)]]
+
+    SimilarArtist.query.filter(
+        db.or_(
+            SimilarArtist.artist_id == artist.id,
+            SimilarArtist.similar_artist_id == artist.id,
+        )
+    ).delete(synchronize_session=False)
+    RecommendedVenue.query.filter_by(artist_id=artist.id).delete(
+        synchronize_session=False
+    )
+    _insert(SimilarArtist.__table__, similar + referring)
+    _insert(RecommendedVenue.__table__, recommended)
+
+    # lists that were already full lose their old kth entry
+    if full:
+        ranked = (
+            db.session.query(
+                SimilarArtist.artist_id,
+                SimilarArtist.similar_artist_id,
+                func.row_number()
+                .over(
+                    partition_by=SimilarArtist.artist_id,
+                    order_by=(
+                        SimilarArtist.score.desc(),
+                        SimilarArtist.similar_artist_id,
+                    ),
+                )
+                .label("rank"),
+            )
+            .filter(SimilarArtist.artist_id.in_(full))
+            .subquery()
+        )
+        SimilarArtist.query.filter(
+            db.tuple_(SimilarArtist.artist_id, SimilarArtist.similar_artist_id).in_(
+                db.session.query(ranked.c.artist_id, ranked.c.similar_artist_id).filter(
+                    ranked.c.rank > k
+                )
+            )
+        ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+class Updates:
+    """Runs update_artist() off the request path.
+
+    One worker per process, so updates never race each other over the
+    same lists. Queued updates are lost if the process stops; the nightly
+    rebuild_all() catches up with them.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.executor = None
+
+    def init_app(self, app):
+        self.app = app
+        self.start_executor()
+        # a forked worker gets the executor but none of its threads
+        os.register_at_fork(after_in_child=self.start_executor)
+
+    def start_executor(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="recommendations"
+        )
+
+    def submit(self, artist_id):
+        return self.executor.submit(self.run, artist_id)
+
+    def run(self, artist_id):
+        with self.app.app_context():
+            try:
+                artist = db.session.get(Artist, artist_id)
+                if artist is not None:
+                    update_artist(artist)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception(
+                    f"Recommendations could not be updated for artist {artist_id}"
+                )
+            finally:
+                db.session.remove()
+
+    def wait(self):
+        # the single worker runs in order, so this returns once everything
+        # queued before it is done
+        self.executor.submit(lambda: None).result()
+
+
+updates = Updates()
+
+
+# ----------------------------------------------------------------------------#
+# Loaders.
+# ----------------------------------------------------------------------------#
+
+
+def similar_artists(artist_id, limit=TOP_K):
+    rows = (
+        db.session.query(Artist.id, Artist.name, Artist.image_link, SimilarArtist.score)
+        .join(SimilarArtist, SimilarArtist.similar_artist_id == Artist.id)
+        .filter(SimilarArtist.artist_id == artist_id)
+        .order_by(SimilarArtist.score.desc(), Artist.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {"id": id, "name": name, "image_link": image_link, "score": score}
+        for id, name, image_link, score in rows
+    ]
+
+
+def recommended_venues(artist_id, limit=TOP_K):
+    rows = (
+        db.session.query(Venue.id, Venue.name, Venue.image_link, RecommendedVenue.score)
+        .join(RecommendedVenue, RecommendedVenue.venue_id == Venue.id)
+        .filter(RecommendedVenue.artist_id == artist_id)
+        .order_by(RecommendedVenue.score.desc(), Venue.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {"id": id, "name": name, "image_link": image_link, "score": score}
+        for id, name, image_link, score in rows
+    ]
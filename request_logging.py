@@ -0,0 +1,134 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ----------------------------------------------------------------------------#
+# Structured request logging.
+#
+# Records are formatted to JSON on the calling thread and put on an
+# in-memory queue; a QueueListener thread is the only thing that touches
+# the log file, so request threads never block on disk. Threads don't
+# survive fork, so a forked worker (gunicorn preload_app) starts its own
+# listener on a fresh queue.
+# ----------------------------------------------------------------------------#
+
+REQUEST_FIELDS = (
+    "method",
+    "route",
+    "path",
+    "status",
+    "latency_ms",
+    "db_ms",
+    "db_queries",
+)
+
+request_logger = logging.getLogger("fyyur.requests")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in REQUEST_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if has_request_context() and "route" not in entry:
+            entry["route"] = request.endpoint
+            entry["path"] = request.path
+        if record.exc_info:
+            entry["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "db_time" in g:
+        g.db_time += time.perf_counter() - context.query_start
+        g.db_queries += 1
+
+
+def start_listener(log_queue, handler):
+    listener = QueueListener(log_queue, handler, respect_handler_level=False)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def init_app(app):
+    file_handler = logging.FileHandler(app.config["LOG_FILE"])
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    # QueueHandler.prepare() formats on the calling thread, so the JSON line
+    # (including any traceback) is built before the record is queued
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.setFormatter(JsonFormatter())
+    listener = start_listener(queue_handler.queue, file_handler)
+
+    def restart_in_child():
+        # records the parent queued but hadn't written yet stay with it
+        queue_handler.queue = queue.SimpleQueue()
+        start_listener(queue_handler.queue, file_handler)
+
+    os.register_at_fork(after_in_child=restart_in_child)
+
+    level = app.config["LOG_LEVEL"]
+    for logger in (app.logger, request_logger):
+        logger.setLevel(level)
+        logger.addHandler(queue_handler)
+    request_logger.propagate = False
+    # Flask's own handler writes to stderr on the request thread; keep it
+    # in debug mode, where errors belong on the console
+    if not app.debug:
+        app.logger.removeHandler(default_handler)
+
+    sample_rate = app.config["LOG_SUCCESS_SAMPLE_RATE"]
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.db_time = 0.0
+        g.db_queries = 0
+
+    @app.after_request
+    def log_request(response):
+        # errors are always logged, successes only at the sample rate
+        if response.status_code < 400 and random.random() >= sample_rate:
+            return response
+        if "request_start" not in g:
+            return response
+
+        request_logger.info(
+            "request",
+            extra={
+                "method": request.method,
+                "route": request.endpoint,
+                "path": request.path,
+                "status": response.status_code,
+                "latency_ms": round((time.perf_counter() - g.request_start) * 1000, 2),
+                "db_ms": round(g.db_time * 1000, 2),
+                "db_queries": g.db_queries,
+            },
+        )
+        return response
+
+    return listener
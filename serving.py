@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import text
+
+from models import db, Artist, Venue
+from entity_cache import entity_cache
+
+# ----------------------------------------------------------------------------#
+# Production serving support: warmup, health checks and graceful drain.
+# See gunicorn.conf.py for how these hooks are wired into the workers.
+# ----------------------------------------------------------------------------#
+
+ready = threading.Event()
+draining = threading.Event()
+
+
+def compile_templates(app):
+    # jinja compiles lazily on first render; doing it up front (in the
+    # preloading master) means workers fork with the code objects shared
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
+
+
+def prime_pool(app):
+    # hold several connections at once so each one is really opened
+    with app.app_context():
+        connections = [
+            db.engine.connect() for _ in range(app.config["WARMUP_DB_CONNECTIONS"])
+        ]
+        for connection in connections:
+            connection.execute(text("SELECT 1"))
+            connection.close()
+
+
+def prime_caches(app):
+    limit = app.config["WARMUP_ENTITY_CACHE_SIZE"]
+    with app.app_context():
+        for model in (Venue, Artist):
+            newest = db.session.query(model.id).order_by(model.id.desc()).limit(limit)
+            entity_cache.get_many(model, [id for id, in newest])
+        db.session.remove()
+
+
+def warmup_master(app):
+    compile_templates(app)
+
+
+def warmup_worker(app):
+    started = time.monotonic()
+    # connections opened before fork must not be shared with the children
+    with app.app_context():
+        db.engine.dispose()
+    prime_pool(app)
+    prime_caches(app)
+    ready.set()
+    app.logger.info(f"worker {os.getpid()} warm in {time.monotonic() - started:.2f}s")
+
+
+def drain(app, stop):
+    """Fail readiness, keep serving for DRAIN_SECONDS, then call stop."""
+    draining.set()
+    timer = threading.Timer(app.config["DRAIN_SECONDS"], stop)
+    timer.daemon = True
+    timer.start()
+
+
+def init_app(app):
+    @app.route("/healthz")
+    def healthz():
+        # liveness only - the process is up and serving requests
+        return jsonify({"status": "ok"})
+
+    @app.route("/readyz")
+    def readyz():
+        if draining.is_set():
+            return jsonify({"status": "draining"}), 503
+        if not ready.is_set():
+            return jsonify({"status": "warming up"}), 503
+        try:
+            db.session.execute(text("SELECT 1"))
+        except Exception:
+            app.logger.exception("Readiness check could not reach the database")
+            return jsonify({"status": "database unavailable"}), 503
+        return jsonify({"status": "ready"})
@@ -0,0 +1,327 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import Response
+from sqlalchemy import func, literal
+
+from models import db, Artist, Show, ShowEvent, Venue
+
+# ----------------------------------------------------------------------------#
+# Live show feed.
+#
+# Handlers that create, change or delete shows add ShowEvent rows in the
+# same transaction (a transactional outbox), so an event exists exactly
+# when its change committed. Each process runs one dispatcher thread that
+# polls the outbox and hands new events to the in-memory queues of its
+# subscribers; /events/shows streams them as server-sent events. Events
+# are delivered in id order, except that an id the dispatcher gave up
+# waiting for is still delivered (late) if its transaction commits within
+# EVENTS_GAP_RECHECK_SECONDS.
+#
+# An open stream holds its worker thread, so the feed is meant to be served
+# by gevent workers (GUNICORN_WORKER_CLASS=gevent, see README), where the
+# dispatcher and every stream are greenlets and an idle client costs a few
+# kilobytes. Anywhere else (gthread workers, the dev server) a stream ties
+# up a thread, so only EVENTS_MAX_THREADED_SUBSCRIBERS are admitted. Clients
+# that reconnect send Last-Event-ID and are replayed whatever they missed
+# from the outbox.
+# ----------------------------------------------------------------------------#
+
+
+def greenlet_threads():
+    """True when threading has been monkey patched by gevent."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+# most id ranges skipped in gaps that are rechecked at once
+MAX_GAPS = 100
+
+
+class Subscriber:
+    def __init__(self, venue_id, artist_id, size):
+        self.venue_id = venue_id
+        self.artist_id = artist_id
+        self.events = queue.Queue(maxsize=size)
+        self.dropped = False
+
+    def matches(self, event):
+        return (self.venue_id is None or event["venue_id"] == self.venue_id) and (
+            self.artist_id is None or event["artist_id"] == self.artist_id
+        )
+
+    def put(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # a client this far behind is cut off; it reconnects with
+            # Last-Event-ID and catches up from the outbox instead
+            self.dropped = True
+
+
+class ShowFeed:
+    def __init__(self):
+        self.app = None
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.dispatcher = None
+        self.last_id = None
+        self.published = 0
+        # when the dispatcher started waiting at the current gap, and the
+        # (low, high, until) id ranges it skipped and still rechecks
+        self.gap_since = None
+        self.gaps = []
+
+    def init_app(self, app):
+        self.app = app
+        self.poll_interval = app.config["EVENTS_POLL_INTERVAL"]
+        self.batch_size = app.config["EVENTS_BATCH_SIZE"]
+        self.gap_seconds = app.config["EVENTS_GAP_SECONDS"]
+        self.gap_recheck_seconds = app.config["EVENTS_GAP_RECHECK_SECONDS"]
+        self.keepalive = app.config["EVENTS_KEEPALIVE"]
+        self.max_subscribers = (
+            app.config["EVENTS_MAX_SUBSCRIBERS"]
+            if greenlet_threads()
+            else app.config["EVENTS_MAX_THREADED_SUBSCRIBERS"]
+        )
+        self.queue_size = app.config["EVENTS_QUEUE_SIZE"]
+
+    # outbox
+
+    def record_show(self, kind, show):
+        """Add an outbox row for one show to the current transaction."""
+        # ids come straight from the form as strings on create
+        db.session.add(
+            ShowEvent(
+                kind=kind,
+                show_id=show.id,
+                venue_id=int(show.venue_id),
+                artist_id=int(show.artist_id),
+                start_time=show.start_time,
+            )
+        )
+
+    def record_shows(self, kind, upcoming=False, **filters):
+        """Add outbox rows for every show matching filters (venue_id or artist_id).
+
+        upcoming leaves out the shows that have already started. Must run
+        before a delete, in the same transaction, so the shows are still
+        there to be selected.
+        """
+        shows = db.session.query(
+            literal(kind), Show.id, Show.venue_id, Show.artist_id, Show.start_time
+        ).filter(*[getattr(Show, key) == value for key, value in filters.items()])
+        if upcoming:
+            shows = shows.filter(Show.start_time >= datetime.now())
+        db.session.execute(
+            ShowEvent.__table__.insert().from_select(
+                ["kind", "show_id", "venue_id", "artist_id", "start_time"], shows
+            )
+        )
+
+    # subscribers
+
+    def subscribe(self, venue_id=None, artist_id=None):
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(venue_id, artist_id, self.queue_size)
+            self.subscribers.add(subscriber)
+            self.start_dispatcher()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, events):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for event in events:
+            for subscriber in subscribers:
+                if subscriber.matches(event):
+                    subscriber.put(event)
+        self.published += len(events)
+
+    # dispatcher
+
+    def start_dispatcher(self):
+        # started by the first subscriber, so a preloading master never
+        # forks with the thread (and its connection) already running
+        if self.dispatcher is None or not self.dispatcher.is_alive():
+            self.dispatcher = threading.Thread(
+                target=self.dispatch_forever, name="show-feed", daemon=True
+            )
+            self.dispatcher.start()
+
+    def dispatch_forever(self):
+        with self.app.app_context():
+            if self.last_id is None:
+                self.last_id = db.session.query(func.max(ShowEvent.id)).scalar() or 0
+                db.session.remove()
+            while True:
+                try:
+                    self.poll()
+                except Exception:
+                    self.app.logger.exception("Show feed poll failed")
+                finally:
+                    db.session.remove()
+                time.sleep(self.poll_interval)
+
+    def poll(self):
+        # gaps are timed on this process's clock alone; created_at is when
+        # the writing transaction started, not when it committed
+        now = time.monotonic()
+        rows = (
+            db.session.query(ShowEvent)
+            .filter(ShowEvent.id > self.last_id)
+            .order_by(ShowEvent.id)
+            .limit(self.batch_size)
+            .all()
+        )
+        batch = []
+        for row in rows:
+            # ids are handed out before commit, so a lower id can still
+            # appear; wait at a gap for a while, then go on without it
+            if row.id != self.last_id + 1:
+                if self.gap_since is None:
+                    self.gap_since = now
+                if now - self.gap_since < self.gap_seconds:
+                    break
+                until = now + self.gap_recheck_seconds
+                self.gaps.append((self.last_id + 1, row.id - 1, until))
+                del self.gaps[:-MAX_GAPS]
+            self.gap_since = None
+            batch.append(row)
+            self.last_id = row.id
+        batch += self.recheck_gaps(now)
+        if batch:
+            self.publish(self.describe(batch))
+
+    def recheck_gaps(self, now):
+        """Events committed since their ids were skipped in a gap."""
+        self.gaps = [gap for gap in self.gaps if gap[2] > now]
+        if not self.gaps:
+            return []
+        in_gaps = [ShowEvent.id.between(low, high) for low, high, _ in self.gaps]
+        rows = (
+            db.session.query(ShowEvent)
+            .filter(db.or_(*in_gaps))
+            .order_by(ShowEvent.id)
+            .limit(self.batch_size)
+            .all()
+        )
+
+        # what is left of each range once the ids just found are taken out
+        gaps = []
+        for low, high, until in self.gaps:
+            for row in rows:
+                if low <= row.id <= high:
+                    if row.id > low:
+                        gaps.append((low, row.id - 1, until))
+                    low = row.id + 1
+            if low <= high:
+                gaps.append((low, high, until))
+        self.gaps = gaps
+        return rows
+
+    def describe(self, rows):
+        # read names fresh rather than through the entity cache: "updated"
+        # events exist because a name or image just changed, possibly in
+        # another process whose cache invalidation this one never saw
+        venues = dict(
+            db.session.query(Venue.id, Venue.name).filter(
+                Venue.id.in_({row.venue_id for row in rows})
+            )
+        )
+        artists = {
+            id: (name, image_link)
+            for id, name, image_link in db.session.query(
+                Artist.id, Artist.name, Artist.image_link
+            ).filter(Artist.id.in_({row.artist_id for row in rows}))
+        }
+        events = []
+        for row in rows:
+            # deleted venues and artists are gone by the time we look
+            artist_name, artist_image_link = artists.get(row.artist_id, (None, None))
+            events.append(
+                {
+                    "id": row.id,
+                    "kind": row.kind,
+                    "show_id": row.show_id,
+                    "venue_id": row.venue_id,
+                    "venue_name": venues.get(row.venue_id),
+                    "artist_id": row.artist_id,
+                    "artist_name": artist_name,
+                    "artist_image_link": artist_image_link,
+                    "start_time": str(row.start_time),
+                }
+            )
+        return events
+
+    def missed(self, last_event_id, venue_id=None, artist_id=None):
+        query = ShowEvent.query.filter(ShowEvent.id > last_event_id)
+        if venue_id is not None:
+            query = query.filter_by(venue_id=venue_id)
+        if artist_id is not None:
+            query = query.filter_by(artist_id=artist_id)
+        rows = query.order_by(ShowEvent.id).limit(self.queue_size).all()
+        return self.describe(rows) if rows else []
+
+    # streaming
+
+    def stream(self, subscriber, missed=()):
+        try:
+            yield f"retry: {self.keepalive * 1000}\n\n"
+            last_id = 0
+            for event in missed:
+                last_id = event["id"]
+                yield format_event(event)
+            while not subscriber.dropped:
+                try:
+                    event = subscriber.events.get(timeout=self.keepalive)
+                except queue.Empty:
+                    # also how a disconnected client is noticed: the write fails
+                    yield ": keepalive\n\n"
+                    continue
+                if event["id"] > last_id:
+                    yield format_event(event)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def response(self, subscriber, missed=()):
+        return Response(
+            self.stream(subscriber, missed),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+        )
+
+    def stats(self):
+        with self.lock:
+            return {
+                "subscribers": len(self.subscribers),
+                "max_subscribers": self.max_subscribers,
+                "last_id": self.last_id,
+                "published": self.published,
+                "dispatcher": self.dispatcher is not None and self.dispatcher.is_alive(),
+            }
+
+    def prune(self, older_than):
+        deleted = ShowEvent.query.filter(
+            ShowEvent.created_at < func.now() - older_than
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {json.dumps(event)}\n\n"
+
+
+show_feed = ShowFeed()
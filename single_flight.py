@@ -0,0 +1,92 @@
+import threading
+from collections import Counter
+
+# ----------------------------------------------------------------------------#
+# Single-flight request coalescing.
+#
+# Concurrent calls with the same key share one execution: the first caller
+# (the leader) runs the function and every caller that arrives while it is
+# still running waits for, and returns, the leader's result. Results are
+# handed to other threads, so functions must return plain data, not ORM
+# objects bound to the leader's session.
+#
+# Keys are tuples named by their first element, e.g. ("show_venue", 3);
+# SINGLE_FLIGHT_TIMEOUTS sets how long waiters on each name wait.
+# ----------------------------------------------------------------------------#
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.timeout = None
+        self.timeouts = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def init_app(self, app):
+        self.timeout = app.config["SINGLE_FLIGHT_TIMEOUT"]
+        self.timeouts = app.config["SINGLE_FLIGHT_TIMEOUTS"]
+
+    def timeout_for(self, key):
+        name = key[0] if isinstance(key, tuple) else key
+        return self.timeouts.get(name, self.timeout)
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() once for all concurrent callers using the same key.
+
+        A waiter gives up after timeout seconds (by default the key's entry
+        in SINGLE_FLIGHT_TIMEOUTS, else SINGLE_FLIGHT_TIMEOUT) and runs fn()
+        itself rather than fail the request.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.counts["leaders"] += 1
+            else:
+                call.waiters += 1
+
+        if not leader:
+            if timeout is None:
+                timeout = self.timeout_for(key)
+            shared = call.done.wait(timeout)
+            with self.lock:
+                call.waiters -= 1
+                # only waiters that got the leader's outcome were saved work
+                self.counts["deduplicated" if shared else "timeouts"] += 1
+            if not shared:
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self.lock:
+            return dict(
+                self.counts,
+                in_flight=len(self.calls),
+                waiting=sum(call.waiters for call in self.calls.values()),
+            )
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,147 @@
+import gzip
+import json
+import os
+from xml.sax.saxutils import escape
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+from models import db, Artist, Venue
+
+# ----------------------------------------------------------------------------#
+# XML sitemaps.
+#
+# Venue and Artist pages are listed in gzipped sitemap files of up to
+# SITEMAP_URLS ids each - venues-1.xml.gz covers venue ids 1..50000 and so
+# on - under a sitemap.xml index, all written to SITEMAP_DIR and served as
+# static files. `flask sitemap generate` (run from cron) rewrites only the
+# segments whose row count or newest updated_at changed since the last run,
+# as recorded in manifest.json, streaming their rows with a server-side
+# cursor.
+# ----------------------------------------------------------------------------#
+
+KINDS = {"venues": Venue, "artists": Artist}
+INDEX = "sitemap.xml"
+MANIFEST = "manifest.json"
+XMLNS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+def lastmod(value):
+    # W3C datetime with the server's UTC offset
+    return value.astimezone().isoformat(timespec="seconds") if value else None
+
+
+def segment_name(kind, segment):
+    return f"{kind}-{segment + 1}.xml.gz"
+
+
+def segment_states(model, size):
+    """{segment: {"count": rows, "lastmod": newest updated_at}} in one scan."""
+    segment = ((model.id - 1) // size).label("segment")
+    rows = db.session.query(segment, func.count(), func.max(model.updated_at)).group_by(
+        segment
+    )
+    return {
+        segment: {"count": count, "lastmod": lastmod(updated_at)}
+        for segment, count, updated_at in rows
+    }
+
+
+def write_atomically(path, write, opener=open):
+    partial = path + ".partial"
+    with opener(partial, "wt", encoding="utf-8") as f:
+        write(f)
+    os.replace(partial, path)
+
+
+def write_segment(path, kind, model, segment, size, base_url):
+    lower, upper = segment * size + 1, (segment + 1) * size
+    rows = (
+        db.session.query(model.id, model.updated_at)
+        .filter(model.id.between(lower, upper))
+        .order_by(model.id)
+        .execution_options(stream_results=True, yield_per=5000)
+    )
+
+    def write(f):
+        f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n')
+        for id, updated_at in rows:
+            f.write(f"<url><loc>{base_url}/{kind}/{id}</loc>")
+            if updated_at is not None:
+                f.write(f"<lastmod>{lastmod(updated_at)}</lastmod>")
+            f.write("</url>\n")
+        f.write("</urlset>\n")
+
+    write_atomically(path, write, gzip.open)
+
+
+def write_index(path, segments, base_url):
+    def write(f):
+        f.write(
+            f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{XMLNS}">\n'
+        )
+        for name, state in sorted(segments.items()):
+            f.write(f"<sitemap><loc>{base_url}/sitemaps/{name}</loc>")
+            if state["lastmod"]:
+                f.write(f"<lastmod>{state['lastmod']}</lastmod>")
+            f.write("</sitemap>\n")
+        f.write("</sitemapindex>\n")
+
+    write_atomically(path, write)
+
+
+def generate(directory=None, force=False):
+    """Bring the sitemaps in directory up to date; returns the files rewritten."""
+    directory = directory or current_app.config["SITEMAP_DIR"]
+    size = current_app.config["SITEMAP_URLS"]
+    base_url = escape(current_app.config["SITEMAP_BASE_URL"].rstrip("/"))
+    os.makedirs(directory, exist_ok=True)
+
+    manifest_path = os.path.join(directory, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    if manifest.get("base_url") != base_url or manifest.get("size") != size:
+        force = True
+    previous = {} if force else manifest.get("segments", {})
+
+    segments = {}
+    rewritten = []
+    for kind, model in KINDS.items():
+        for segment, state in segment_states(model, size).items():
+            name = segment_name(kind, segment)
+            segments[name] = state
+            path = os.path.join(directory, name)
+            if previous.get(name) == state and os.path.exists(path):
+                continue
+            write_segment(path, kind, model, segment, size, base_url)
+            rewritten.append(name)
+    db.session.remove()
+
+    # segments whose rows were all deleted
+    for name in set(manifest.get("segments", {})) - set(segments):
+        if os.path.exists(os.path.join(directory, name)):
+            os.unlink(os.path.join(directory, name))
+
+    if rewritten or set(segments) != set(manifest.get("segments", {})) or force:
+        write_index(os.path.join(directory, INDEX), segments, base_url)
+        rewritten.append(INDEX)
+    write_atomically(
+        manifest_path,
+        lambda f: json.dump({"base_url": base_url, "size": size, "segments": segments}, f),
+    )
+    return rewritten
+
+
+sitemap_cli = AppGroup("sitemap", help="Generate the XML sitemaps.")
+
+
+@sitemap_cli.command("generate")
+@click.option("--force", is_flag=True, help="Rewrite every segment.")
+def generate_command(force):
+    rewritten = generate(force=force)
+    click.echo(f"rewrote {', '.join(rewritten)}" if rewritten else "sitemaps up to date")
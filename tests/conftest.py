@@ -0,0 +1,130 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ----------------------------------------------------------------------------#
+# Seeded Postgres for the budget tests.
+#
+# Uses TEST_DATABASE_URL when set (the database is dropped and recreated),
+# otherwise starts a throwaway server with pgserver if it is installed.
+# The dataset is generated from a fixed seed so query counts and render
+# times are comparable between runs.
+# ----------------------------------------------------------------------------#
+
+SEED = 1234
+VENUES = 50
+ARTISTS = 200
+SHOWS = 1000
+
+GENRES = ["Blues", "Classical", "Country", "Electronic", "Folk", "Funk", "Jazz",
+          "Pop", "Punk", "R&B", "Reggae", "Rock n Roll", "Soul"]
+PLACES = [("San Francisco", "CA"), ("New York", "NY"), ("Austin", "TX"),
+          ("Chicago", "IL"), ("Seattle", "WA")]
+
+
+def database_url():
+    url = os.environ.get("TEST_DATABASE_URL")
+    if url:
+        return url
+    try:
+        import pgserver
+    except ImportError:
+        return None
+    server = pgserver.get_server(tempfile.mkdtemp(prefix="fyyur-pg-"), cleanup_mode="delete")
+    server.psql("CREATE DATABASE fyyur_test;")
+    return server.get_uri("fyyur_test")
+
+
+def pytest_configure(config):
+    # app.py binds the database and reads its paths when it is imported,
+    # and the budget tests import it while collecting, so both have to be
+    # settled first
+    url = database_url()
+    if url:
+        os.environ["DATABASE_URL"] = url
+    os.environ["FYYUR_TEST_DATABASE"] = url or ""
+
+    import config as settings
+
+    config.fyyur_tmp = tempfile.mkdtemp(prefix="fyyur-test-")
+    settings.LOG_FILE = os.path.join(config.fyyur_tmp, "fyyur.log")
+    settings.IMAGE_CACHE_DIR = os.path.join(config.fyyur_tmp, "image_cache")
+    settings.SITEMAP_DIR = os.path.join(config.fyyur_tmp, "sitemaps")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(config.fyyur_tmp, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not os.environ["FYYUR_TEST_DATABASE"]:
+        pytest.skip("set TEST_DATABASE_URL or install pgserver")
+    from app import app
+    from models import db
+    from partitions import ensure_partitions
+    from sitemaps import generate as generate_sitemaps
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(db)
+        # moves the seeded shows out of the default partition
+        ensure_partitions()
+        generate_sitemaps()
+    yield app
+
+
+def seed(db):
+    from models import Artist, Show, Venue
+
+    rng = random.Random(SEED)
+    now = datetime.now().replace(microsecond=0)
+
+    venues = []
+    for i in range(VENUES):
+        city, state = PLACES[i % len(PLACES)]
+        venues.append(
+            Venue(
+                name=f"Venue {i}",
+                city=city,
+                state=state,
+                address=f"{i} Main St",
+                phone="555-000-0000",
+                genres=rng.sample(GENRES, 3),
+                seeking_talent=i % 2 == 0,
+            )
+        )
+    artists = []
+    for i in range(ARTISTS):
+        city, state = PLACES[i % len(PLACES)]
+        artists.append(
+            Artist(
+                name=f"Artist {i}",
+                city=city,
+                state=state,
+                phone="555-000-0000",
+                genres=rng.sample(GENRES, 2),
+                seeking_venue=i % 3 == 0,
+            )
+        )
+    db.session.add_all(venues + artists)
+    db.session.flush()
+
+    db.session.add_all(
+        Show(
+            venue_id=rng.choice(venues).id,
+            artist_id=rng.choice(artists).id,
+            start_time=now + timedelta(days=rng.randint(-365, 365)),
+        )
+        for _ in range(SHOWS)
+    )
+    db.session.commit()
@@ -0,0 +1,195 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from budgets import budget_for
+from conftest import ARTISTS, VENUES
+
+# ----------------------------------------------------------------------------#
+# Query and render-time budgets.
+#
+# Every route in app.py declares a @query_budget; this renders each one
+# against the seeded database (with the entity cache cold) and fails when
+# it issues more SQL statements than its budget. Render times depend on
+# the machine, so they are only checked when BUDGET_TIME_FACTOR is set
+# (1 on the reference machine, more on slower ones).
+# ----------------------------------------------------------------------------#
+
+TIME_FACTOR = os.environ.get("BUDGET_TIME_FACTOR")
+
+# url arguments for GET routes
+URL_ARGS = {
+    "venue_id": 1,
+    "artist_id": 1,
+    "id": 1,
+    "kind": "venue",
+    "size": "small",
+    "name": "venues-1.xml.gz",
+}
+
+VENUE_FORM = {
+    "name": "Venue 1 (renamed)",
+    "city": "San Francisco",
+    "state": "CA",
+    "address": "1 Main St",
+    "phone": "555-000-0000",
+    "genres": ["Jazz", "Blues"],
+    "image_link": "",
+    "facebook_link": "",
+    "website_link": "",
+    "seeking_description": "",
+}
+ARTIST_FORM = {
+    "name": "Artist 1 (renamed)",
+    "city": "San Francisco",
+    "state": "CA",
+    "phone": "555-000-0000",
+    "genres": ["Jazz", "Soul"],
+    "image_link": "",
+    "facebook_link": "",
+    "website_link": "",
+    "seeking_description": "",
+}
+
+# everything that isn't a GET needs a request to send; deletes use the
+# last rows so they don't remove anything the other routes render
+REQUESTS = {
+    ("POST", "search_venues"): ("/venues/search", {"search_term": "venue 1"}),
+    ("POST", "search_artists"): ("/artists/search", {"search_term": "artist 1"}),
+    ("POST", "create_venue_submission"): ("/venues/create", VENUE_FORM),
+    ("POST", "create_artist_submission"): ("/artists/create", ARTIST_FORM),
+    ("POST", "create_show_submission"): (
+        "/shows/create",
+        {"artist_id": "1", "venue_id": "1", "start_time": "2031-05-05 20:00:00"},
+    ),
+    ("POST", "edit_venue_submission"): ("/venues/2/edit", VENUE_FORM),
+    ("POST", "edit_artist_submission"): ("/artists/2/edit", ARTIST_FORM),
+    ("DELETE", "delete_venue"): (f"/venues/{VENUES}", None),
+    ("DELETE", "delete_artist"): (f"/artists/{ARTISTS}", None),
+}
+
+# routes that legitimately don't answer 2xx/3xx with the seeded data
+EXPECTED_STATUS = {
+    # seeded rows have no image_link
+    "image": 404,
+}
+
+
+def app_routes():
+    import app as module
+
+    routes = []
+    for rule in module.app.url_map.iter_rules():
+        view = module.app.view_functions[rule.endpoint]
+        if view.__module__ != module.__name__:
+            continue
+        for method in sorted(rule.methods - {"HEAD", "OPTIONS"}):
+            routes.append((method, rule, view))
+    return routes
+
+
+def route_id(route):
+    method, rule, view = route
+    return f"{method} {rule.rule}"
+
+
+ROUTES = app_routes()
+
+
+def build_request(method, rule):
+    if (method, rule.endpoint) in REQUESTS:
+        return REQUESTS[(method, rule.endpoint)]
+    if method != "GET":
+        pytest.fail(f"add a request for {method} {rule.rule} to REQUESTS")
+    return rule.build({arg: URL_ARGS[arg] for arg in rule.arguments})[1], None
+
+
+class StatementRecorder:
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        # only the request's own statements, not background threads'
+        self.thread = threading.get_ident()
+        event.listen(Engine, "before_cursor_execute", self.record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, "before_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        # SET LOCAL statement_timeout (load_shedding.py) is per transaction
+        # setup, not a query the view asked for
+        if threading.get_ident() == self.thread and not statement.startswith("SET "):
+            self.statements.append(statement)
+
+    def report(self):
+        # literals are already bound parameters; collapse whitespace and
+        # IN (...) lists so repeated statements (N+1s) group together
+        counts = Counter(
+            re.sub(r"IN \([^)]*\)", "IN (...)", " ".join(statement.split()))
+            for statement in self.statements
+        )
+        return "\n".join(
+            f"  {count:4d} x {statement[:200]}" for statement, count in counts.most_common()
+        )
+
+
+@pytest.fixture(autouse=True)
+def cold_caches(app):
+    from entity_cache import entity_cache
+    import serving
+
+    serving.compile_templates(app)
+    with entity_cache.lock:
+        entity_cache.entries.clear()
+
+
+def test_every_route_has_a_budget():
+    missing = [route_id(route) for route in ROUTES if budget_for(route[2]) is None]
+    assert not missing, "routes without @query_budget:\n  " + "\n  ".join(missing)
+
+
+@pytest.mark.parametrize("route", ROUTES, ids=route_id)
+def test_route_within_budget(app, route, caplog):
+    method, rule, view = route
+    budget = budget_for(view)
+    if budget is None:
+        pytest.skip("no budget declared")
+    path, data = build_request(method, rule)
+
+    client = app.test_client()
+    with StatementRecorder() as recorder:
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=data)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+    expected = EXPECTED_STATUS.get(rule.endpoint)
+    if expected is not None:
+        assert response.status_code == expected
+    else:
+        assert response.status_code < 400, f"{method} {path} -> {response.status_code}"
+
+    # handlers that catch their own errors still answer 302
+    errors = [record.getMessage() for record in caplog.records if record.levelno >= logging.ERROR]
+    assert not errors, f"{method} {path} logged errors: {errors}"
+
+    queries = len(recorder.statements)
+    problems = []
+    if queries > budget["queries"]:
+        problems.append(f"{queries} queries, budget {budget['queries']}")
+    if TIME_FACTOR:
+        render_ms = budget["render_ms"] * float(TIME_FACTOR)
+        if elapsed_ms > render_ms:
+            problems.append(f"{elapsed_ms:.0f}ms, budget {render_ms:.0f}ms")
+    assert not problems, (
+        f"{method} {path} over budget ({'; '.join(problems)})\n"
+        f"statements:\n{recorder.report()}"
+    )
@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import text
+
+from entity_cache import EntityCache, LocalSharedTier
+from models import db, Artist
+
+
+@pytest.fixture
+def cache(app):
+    cache = EntityCache()
+    cache.init_app(app)
+    cache.shared = LocalSharedTier()
+    return cache
+
+
+def other_process_renames(artist_id, name):
+    # a writer elsewhere commits, then its after_commit invalidates
+    with db.engine.begin() as connection:
+        return connection.execute(
+            text(
+                'UPDATE "Artist" SET name = :name, version = version + 1 '
+                "WHERE id = :id RETURNING version"
+            ),
+            {"name": name, "id": artist_id},
+        ).scalar()
+
+
+def test_read_racing_an_invalidation_is_not_cached(app, cache):
+    with app.app_context():
+        artist_id, name = db.session.query(Artist.id, Artist.name).first()
+        try:
+            # this reader's snapshot predates the writer's commit
+            db.session.rollback()
+            db.session.connection(
+                execution_options={"isolation_level": "REPEATABLE READ"}
+            )
+            db.session.execute(text("SELECT 1"))
+            version = other_process_renames(artist_id, "Renamed")
+            cache.invalidate(Artist, artist_id, version)
+
+            assert cache.get(Artist, artist_id).name == name
+            db.session.rollback()
+
+            assert cache.get(Artist, artist_id).name == "Renamed"
+            cache.entries.clear()
+            assert cache.get(Artist, artist_id).name == "Renamed"
+        finally:
+            db.session.rollback()
+            other_process_renames(artist_id, name)
+
+
+def test_committed_edits_invalidate_both_tiers(app, cache, monkeypatch):
+    monkeypatch.setattr("entity_cache.entity_cache", cache)
+    with app.app_context():
+        artist = db.session.query(Artist).first()
+        name = artist.name
+        assert cache.get(Artist, artist.id).name == name
+
+        artist.name = "Edited"
+        db.session.commit()
+        assert cache.get(Artist, artist.id).name == "Edited"
+        cache.entries.clear()
+        assert cache.get(Artist, artist.id).name == "Edited"
+
+        artist.name = name
+        db.session.commit()
+
+
+def test_deleted_entities_stay_gone(app, cache):
+    with app.app_context():
+        artist_id, version = db.session.query(Artist.id, Artist.version).first()
+        stale = cache.get(Artist, artist_id)
+        cache.invalidate(Artist, artist_id)
+
+        # a reader that loaded the row before the delete committed
+        key = cache.key(Artist, artist_id)
+        cache._local_set(key, 2 * version, stale)
+        cache.shared.set_many({key: (2 * version, f"{2 * version}|[]")}, 60)
+        assert cache._local_get(key) is None
+        assert cache.shared.get_many([key]) == [f"{2**53}|"]
@@ -0,0 +1,113 @@
+import io
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from PIL import Image
+
+from images import ImageCache, UnsafeURL, check_address, fetch_url
+from models import db, Artist
+
+
+def png(colour):
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 600), colour).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+SOURCES = {
+    "http://images.example/red.png": png("red"),
+    "http://images.example/blue.png": png("blue"),
+}
+
+
+@pytest.fixture
+def cache(app, tmp_path, monkeypatch):
+    fetched = []
+
+    def fetcher(url, timeout, limit):
+        fetched.append(url)
+        return SOURCES[url][:limit]
+
+    monkeypatch.setitem(app.config, "IMAGE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setitem(app.config, "IMAGE_FETCH_WAIT", 10)
+    cache = ImageCache(fetcher)
+    cache.init_app(app)
+    cache.fetched = fetched
+    yield cache
+    cache.executor.shutdown()
+
+
+def test_miss_then_hit_then_eviction(cache):
+    red, blue = SOURCES
+
+    path = cache.get(red, "small", "jpeg")
+    assert os.path.exists(path)
+    assert cache.fetched == [red]
+
+    assert cache.get(red, "small", "jpeg") == path
+    assert cache.fetched == [red]
+
+    # room for one thumbnail: rendering the next evicts the least recent
+    os.utime(path, (0, 0))
+    cache.max_bytes = int(os.path.getsize(path) * 1.5)
+    other = cache.get(blue, "small", "jpeg")
+    assert os.path.exists(other)
+    assert not os.path.exists(path)
+    assert cache.fetched == [red, blue]
+
+
+@pytest.mark.parametrize(
+    "address",
+    ["127.0.0.1", "10.1.2.3", "192.168.0.1", "169.254.169.254", "::1", "::ffff:127.0.0.1"],
+)
+def test_internal_addresses_are_refused(address):
+    with pytest.raises(UnsafeURL):
+        check_address(address)
+
+
+def test_public_addresses_are_allowed():
+    check_address("93.184.216.34")
+    check_address("2606:2800:220:1:248:1893:25c8:1946")
+
+
+@pytest.mark.parametrize(
+    "url", ["file:///etc/passwd", "ftp://images.example/a.png", "gopher://x"]
+)
+def test_only_http_urls_are_fetched(url):
+    with pytest.raises(UnsafeURL):
+        fetch_url(url, 1, 100)
+
+
+def test_local_server_is_never_requested():
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested.append(self.path)
+            self.send_response(200)
+            self.end_headers()
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(UnsafeURL):
+            fetch_url(f"http://127.0.0.1:{server.server_port}/secret", 1, 100)
+    finally:
+        server.shutdown()
+    assert requested == []
+
+
+def test_non_http_image_link_is_not_redirected_to(app):
+    with app.app_context():
+        artist = db.session.query(Artist).first()
+        image_link = artist.image_link
+        artist.image_link = "javascript:alert(1)"
+        db.session.commit()
+        try:
+            response = app.test_client().get(f"/img/artist/{artist.id}/small")
+        finally:
+            artist.image_link = image_link
+            db.session.commit()
+    assert response.status_code == 404
@@ -0,0 +1,44 @@
+from sqlalchemy import text
+
+from load_shedding import load_shedder
+from models import db
+
+
+def test_over_limit_class_is_shed_at_once(app):
+    semaphore = load_shedder.semaphores["search"]
+    held = 0
+    while semaphore.acquire(blocking=False):
+        held += 1
+    shed = load_shedder.stats()["search"]["shed"]
+    try:
+        response = app.test_client().post("/venues/search", data={"search_term": "a"})
+    finally:
+        for _ in range(held):
+            semaphore.release()
+
+    assert held == app.config["ROUTE_LIMITS"]["search"]["concurrency"]
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(app.config["SHED_RETRY_AFTER"])
+    assert response.get_json() == {"error": "overloaded", "route_class": "search"}
+    assert load_shedder.stats()["search"]["shed"] == shed + 1
+
+    # the other classes are unaffected
+    assert app.test_client().get("/venues").status_code == 200
+
+
+def test_statement_timeout_answers_503(app, monkeypatch):
+    import app as module
+
+    def slow_search(model, term):
+        return db.session.execute(text("SELECT pg_sleep(1)")).all()
+
+    monkeypatch.setitem(load_shedder.limits["search"], "statement_timeout_ms", 50)
+    monkeypatch.setattr(module, "search_by_name", slow_search)
+    timeouts = load_shedder.stats()["search"]["timeouts"]
+
+    client = app.test_client()
+    response = client.post("/venues/search", data={"search_term": "slow"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(app.config["SHED_RETRY_AFTER"])
+    assert response.get_json() == {"error": "timed out", "route_class": "search"}
+    assert client.get("/load/stats").get_json()["search"]["timeouts"] == timeouts + 1
@@ -0,0 +1,100 @@
+import random
+
+import numpy as np
+import pytest
+
+import matchmaking
+from matchmaking import score_pairs
+from recommendations import GENRES
+
+
+def random_side(rng, count):
+    genres = np.zeros((count, len(GENRES)), dtype=np.float32)
+    for row in genres:
+        row[rng.sample(range(len(GENRES)), rng.randint(0, 3))] = 1
+    # few places, so city and state matches are common
+    state = np.array([rng.randrange(3) for _ in range(count)])
+    city = state * 2 + np.array([rng.randrange(2) for _ in range(count)])
+    return {"genres": genres, "city": city, "state": state}
+
+
+def brute_force_scores(artists, venues, history):
+    # one pair at a time, straight from the weights
+    scores = np.zeros((len(artists["genres"]), len(venues["genres"])))
+    for a, artist_genres in enumerate(artists["genres"]):
+        for v, venue_genres in enumerate(venues["genres"]):
+            union = np.sum(np.maximum(artist_genres, venue_genres))
+            shared = np.sum(np.minimum(artist_genres, venue_genres))
+            score = matchmaking.GENRE_WEIGHT * (shared / union if union else 0)
+            if artists["state"][a] == venues["state"][v]:
+                score += matchmaking.SAME_STATE_WEIGHT
+            if artists["city"][a] == venues["city"][v]:
+                score += matchmaking.SAME_CITY_WEIGHT
+            if (a, v) in history:
+                score += matchmaking.HISTORY_WEIGHT
+            scores[a, v] = score
+    return scores
+
+
+def best(scores, k):
+    return sorted((score for score in scores if score > 0), reverse=True)[:k]
+
+
+@pytest.mark.parametrize("n_artists, n_venues", [(1, 1), (7, 40), (100, 30)])
+def test_score_pairs_matches_brute_force(n_artists, n_venues, monkeypatch):
+    # several blocks, so the per-venue running top k is merged across them
+    monkeypatch.setattr(matchmaking, "BLOCK_SIZE", 16)
+    k = 5
+    rng = random.Random(n_artists * n_venues)
+    artists = random_side(rng, n_artists)
+    venues = random_side(rng, n_venues)
+    history = {
+        (rng.randrange(n_artists), rng.randrange(n_venues))
+        for _ in range(n_artists * 2)
+    }
+    history_arrays = tuple(
+        np.array(side, dtype=np.int64) for side in zip(*sorted(history))
+    )
+
+    artist_index, venue_index, score = score_pairs(artists, venues, history_arrays, k)
+    expected = brute_force_scores(artists, venues, history)
+
+    pairs = list(zip(artist_index.tolist(), venue_index.tolist()))
+    assert len(set(pairs)) == len(pairs)
+    assert score == pytest.approx(expected[artist_index, venue_index], abs=1e-6)
+
+    # every artist's and every venue's k best are all there, whichever block
+    # they were scored in; anything else returned is in the other side's k best
+    by_artist = [[] for _ in range(n_artists)]
+    by_venue = [[] for _ in range(n_venues)]
+    for a, v, s in zip(artist_index, venue_index, score):
+        by_artist[a].append(s)
+        by_venue[v].append(s)
+    for a in range(n_artists):
+        assert best(by_artist[a], k) == pytest.approx(best(expected[a], k), abs=1e-6)
+    for v in range(n_venues):
+        assert best(by_venue[v], k) == pytest.approx(
+            best(expected[:, v], k), abs=1e-6
+        )
+    for a, v, s in zip(artist_index, venue_index, score):
+        artist_kth = best(expected[a], k)[-1]
+        venue_kth = best(expected[:, v], k)[-1]
+        assert s >= min(artist_kth, venue_kth) - 1e-6
+
+
+def test_history_bonus_lifts_a_pair_into_the_top_k():
+    # identical candidates: only the past show tells them apart
+    genres = np.ones((1, len(GENRES)), dtype=np.float32)
+    artists = {"genres": genres, "city": np.array([0]), "state": np.array([0])}
+    venues = {
+        "genres": np.repeat(genres, 4, axis=0),
+        "city": np.zeros(4, dtype=np.int64),
+        "state": np.zeros(4, dtype=np.int64),
+    }
+    history = (np.array([0]), np.array([2]))
+
+    artist_index, venue_index, score = score_pairs(artists, venues, history, k=1)
+    assert venue_index.tolist().count(2) == 1
+    top = venue_index[score.argmax()]
+    assert top == 2
+    assert score.max() == pytest.approx(1.0)
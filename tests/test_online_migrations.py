@@ -0,0 +1,139 @@
+import click
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from models import db, BackfillJob
+from online_migrations import create_index_concurrently, run_backfill
+
+ROWS = 25
+
+
+@pytest.fixture
+def scratch(app):
+    # a plain table: Show is partitioned, which CONCURRENTLY refuses
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    "CREATE TABLE scratch "
+                    "(id serial PRIMARY KEY, value int, doubled int)"
+                )
+            )
+            connection.execute(
+                text(
+                    "INSERT INTO scratch (value) "
+                    "SELECT i % 5 FROM generate_series(1, :n) i"
+                ),
+                {"n": ROWS},
+            )
+            connection.execute(
+                BackfillJob.__table__.insert().values(
+                    name="scratch_doubled",
+                    table="scratch",
+                    column="doubled",
+                    expression="value * 2",
+                    batch_size=10,
+                    last_id=0,
+                    rows_updated=0,
+                    status="pending",
+                    updated_at=db.func.now(),
+                )
+            )
+        yield
+        with db.engine.begin() as connection:
+            connection.execute(text("DROP TABLE scratch"))
+            connection.execute(
+                BackfillJob.__table__.delete().where(
+                    BackfillJob.name == "scratch_doubled"
+                )
+            )
+
+
+def job():
+    with db.engine.connect() as connection:
+        return connection.execute(
+            BackfillJob.__table__.select().where(BackfillJob.name == "scratch_doubled")
+        ).first()
+
+
+def test_backfill_runs_in_batches_and_resumes_after_a_crash(scratch, monkeypatch):
+    lines = []
+
+    def crash(seconds):
+        raise KeyboardInterrupt
+
+    # killed after the first batch committed
+    monkeypatch.setattr("online_migrations.time.sleep", crash)
+    with pytest.raises(KeyboardInterrupt):
+        run_backfill("scratch_doubled", echo=lines.append)
+    assert (job().last_id, job().rows_updated, job().status) == (10, 10, "running")
+    monkeypatch.undo()
+
+    run_backfill("scratch_doubled", sleep=0, echo=lines.append)
+    assert (job().last_id, job().rows_updated, job().status) == (30, ROWS, "done")
+    assert lines == [
+        f"scratch_doubled: ids <= 10 of {ROWS} (10 rows)",
+        f"scratch_doubled: ids <= 20 of {ROWS} (10 rows)",
+        f"scratch_doubled: ids <= {ROWS} of {ROWS} (5 rows)",
+        "scratch_doubled: done",
+    ]
+    with db.engine.connect() as connection:
+        wrong = connection.execute(
+            text(
+                "SELECT count(*) FROM scratch "
+                "WHERE doubled IS DISTINCT FROM value * 2"
+            )
+        ).scalar()
+    assert wrong == 0
+
+
+def test_invalid_index_is_rebuilt(scratch):
+    def index_valid(connection):
+        return connection.execute(
+            text(
+                "SELECT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass('ix_scratch_value')"
+            )
+        ).scalar()
+
+    with db.engine.connect() as connection:
+        migration = MigrationContext.configure(connection)
+        with Operations.context(migration):
+            # the duplicate values fail the unique build part way
+            with pytest.raises(IntegrityError):
+                create_index_concurrently(
+                    "ix_scratch_value", "scratch", ["value"], unique=True
+                )
+            assert index_valid(connection) is False
+            assert connection.execute(text("SHOW lock_timeout")).scalar() == "0"
+            connection.commit()
+
+            create_index_concurrently("ix_scratch_value", "scratch", ["value"])
+            assert index_valid(connection) is True
+            assert connection.execute(text("SHOW lock_timeout")).scalar() == "0"
+
+
+def test_second_run_of_a_backfill_is_refused(app):
+    with app.app_context():
+        with db.engine.connect() as other_run:
+            other_run.execute(
+                text("SELECT pg_advisory_lock(hashtext('backfill:show_ends_at'))")
+            )
+            with pytest.raises(click.ClickException, match="already running"):
+                run_backfill("show_ends_at", echo=lambda line: None)
+            other_run.execute(
+                text("SELECT pg_advisory_unlock(hashtext('backfill:show_ends_at'))")
+            )
+
+        # the lock is released again even when the run fails
+        for _ in range(2):
+            with pytest.raises(click.ClickException, match="no backfill named"):
+                run_backfill("show_ends_at", echo=lambda line: None)
+        with db.engine.connect() as connection:
+            held = connection.execute(
+                text("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'")
+            ).scalar()
+        assert held == 0
@@ -0,0 +1,105 @@
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from models import db, Artist
+
+ARTIST_ID = 3
+
+
+def artist_form(artist, **overrides):
+    form = {
+        "name": artist.name,
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "genres": artist.genres,
+        "image_link": artist.image_link or "",
+        "facebook_link": artist.facebook_link or "",
+        "website_link": artist.website or "",
+        "seeking_description": artist.seeking_description or "",
+        "version": str(artist.version),
+    }
+    if artist.seeking_venue:
+        form["seeking_venue"] = "y"
+    form.update(overrides)
+    return form
+
+
+def current(app):
+    with app.app_context():
+        artist = db.session.get(Artist, ARTIST_ID)
+        db.session.expunge(artist)
+        return artist
+
+
+@pytest.fixture
+def artist(app):
+    artist = current(app)
+    yield artist
+    with app.app_context(), db.engine.begin() as connection:
+        connection.execute(
+            text('UPDATE "Artist" SET name = :name WHERE id = :id'),
+            {"name": artist.name, "id": ARTIST_ID},
+        )
+
+
+def post(app, artist, headers=None, **overrides):
+    return app.test_client().post(
+        f"/artists/{ARTIST_ID}/edit",
+        data=artist_form(artist, **overrides),
+        headers=headers,
+    )
+
+
+def test_stale_form_version_is_refused(app, artist):
+    response = post(app, artist, name="Lost", version=str(artist.version - 1))
+    assert response.status_code == 409
+    assert current(app).name == artist.name
+
+
+def test_stale_if_match_is_refused(app, artist):
+    # the header wins over a current version in the form
+    response = post(app, artist, {"If-Match": f'"{artist.version - 1}"'}, name="Lost")
+    assert response.status_code == 409
+    assert current(app).name == artist.name
+
+
+def test_edit_racing_another_writer_is_refused(app, artist, monkeypatch):
+    import app as module
+
+    original = module.apply_changes
+
+    def apply_then_race(record, values):
+        # someone else commits between the version check and our UPDATE
+        with db.engine.begin() as connection:
+            connection.execute(
+                text('UPDATE "Artist" SET version = version + 1 WHERE id = :id'),
+                {"id": ARTIST_ID},
+            )
+        return original(record, values)
+
+    monkeypatch.setattr(module, "apply_changes", apply_then_race)
+    response = post(app, artist, name="Lost")
+    assert response.status_code == 409
+    assert current(app).name == artist.name
+
+
+def test_edit_bumps_the_version_and_no_op_edit_writes_nothing(app, artist):
+    assert post(app, artist, name="Renamed").status_code == 302
+    edited = current(app)
+    assert (edited.name, edited.version) == ("Renamed", artist.version + 1)
+
+    updates = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE"):
+            updates.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        assert post(app, edited).status_code == 302
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    assert updates == []
+    assert current(app).version == edited.version
@@ -0,0 +1,153 @@
+import csv
+import gzip
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from models import db, Show
+from partitions import (
+    DEFAULT_PARTITION,
+    add_months,
+    archive_partitions,
+    ensure_partitions,
+    partition_month,
+    partitions,
+)
+
+
+def default_partition_count():
+    with db.engine.connect() as connection:
+        return connection.execute(text(f'SELECT count(*) FROM "{DEFAULT_PARTITION}"')).scalar()
+
+
+def test_every_month_with_shows_has_a_partition(app):
+    with app.app_context():
+        ensure_partitions()
+        assert default_partition_count() == 0
+        with db.engine.connect() as connection:
+            months = {partition_month(name) for name in partitions(connection)}
+        show_months = {
+            start.date().replace(day=1)
+            for start, in db.session.query(Show.start_time).distinct()
+        }
+        assert show_months <= months
+
+
+def test_ensure_moves_shows_out_of_the_default_partition(app):
+    with app.app_context():
+        ensure_partitions()
+    response = app.test_client().post(
+        "/shows/create",
+        data={"artist_id": "1", "venue_id": "1", "start_time": "2040-02-03 20:00:00"},
+    )
+    assert response.status_code == 200
+
+    with app.app_context():
+        assert default_partition_count() == 1
+        assert ensure_partitions() == ["Show_y2040m02"]
+        assert default_partition_count() == 0
+        in_partition = db.session.execute(text('SELECT count(*) FROM "Show_y2040m02"'))
+        assert in_partition.scalar() == 1
+
+
+def test_archive_writes_and_drops_old_months(app, tmp_path):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            oldest = partition_month(partitions(connection)[0])
+        expected = Show.query.filter(
+            Show.start_time < datetime.combine(add_months(oldest, 1), datetime.min.time())
+        ).count()
+        db.session.remove()
+
+        [(path, count)] = archive_partitions(add_months(oldest, 1), str(tmp_path))
+        assert count == expected > 0
+
+        with gzip.open(path, "rt", newline="") as archive:
+            rows = list(csv.DictReader(archive))
+        assert len(rows) == expected
+        assert all(row["start_time"].startswith(oldest.strftime("%Y-%m")) for row in rows)
+
+        with db.engine.connect() as connection:
+            assert partition_month(partitions(connection)[0]) > oldest
+
+
+def test_archived_shows_stay_in_the_rollups(app, tmp_path):
+    from analytics import reconcile
+    from models import ShowRollup
+
+    def rollups():
+        return {
+            tuple(row[:4]): tuple(row[4:])
+            for row in db.session.query(
+                ShowRollup.entity,
+                ShowRollup.entity_id,
+                ShowRollup.dimension,
+                ShowRollup.bucket,
+                ShowRollup.shows,
+                ShowRollup.lead_time_seconds,
+            )
+        }
+
+    with app.app_context():
+        reconcile()
+        before = rollups()
+        with db.engine.connect() as connection:
+            oldest = partition_month(partitions(connection)[0])
+        db.session.remove()
+
+        [(_, count)] = archive_partitions(add_months(oldest, 1), str(tmp_path))
+        assert count > 0
+        reconcile()
+        assert rollups() == before
+
+
+def test_archive_resumes_a_partition_left_detached(app, tmp_path, monkeypatch):
+    import analytics
+    from partitions import detached_partitions
+
+    def fail(connection, name):
+        raise RuntimeError("disk full")
+
+    with app.app_context():
+        with db.engine.connect() as connection:
+            oldest = partition_month(partitions(connection)[0])
+        db.session.remove()
+
+        with monkeypatch.context() as patch:
+            patch.setattr(analytics, "archive_rollups", fail)
+            with pytest.raises(RuntimeError):
+                archive_partitions(add_months(oldest, 1), str(tmp_path))
+        with db.engine.connect() as connection:
+            [name] = detached_partitions(connection)
+        assert partition_month(name) == oldest
+
+        # a later run with an earlier cutoff still finishes it
+        [(path, count)] = archive_partitions(oldest, str(tmp_path))
+        assert path.endswith(f"{name}.csv.gz") and count > 0
+        with db.engine.connect() as connection:
+            assert detached_partitions(connection) == []
+            assert partition_month(partitions(connection)[0]) > oldest
+
+
+def test_autogenerate_leaves_the_partitions_alone(app):
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+
+    from partitions import include_object
+
+    with app.app_context():
+        ensure_partitions()
+        with db.engine.connect() as connection:
+            context = MigrationContext.configure(
+                connection, opts={"include_object": include_object}
+            )
+            diff = compare_metadata(context, db.metadata)
+    assert not [change for change in diff if "Show_" in repr(change)]
+
+
+def test_pages_cut_at_the_history_say_so(app):
+    months = app.config["SHOW_HISTORY_MONTHS"]
+    client = app.test_client()
+    assert f"Last {months} Months" in client.get("/venues/1").get_data(as_text=True)
+    assert f"last {months} months" in client.get("/shows").get_data(as_text=True)
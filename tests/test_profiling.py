@@ -0,0 +1,42 @@
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def profiler(app, tmp_path):
+    from profiling import profiler
+
+    token, directory = profiler.token, profiler.directory
+    profiler.token, profiler.directory = "secret", str(tmp_path)
+    yield profiler
+    profiler.token, profiler.directory = token, directory
+
+
+def test_request_with_token_is_profiled(app, profiler):
+    response = app.test_client().get("/venues/1", headers={"X-Profile": "secret"})
+    assert response.status_code == 200
+    name = response.headers["X-Profile"]
+
+    with open(os.path.join(profiler.directory, name + ".speedscope.json")) as f:
+        speedscope = json.load(f)
+    [profile] = speedscope["profiles"]
+    assert len(profile["samples"]) == len(profile["weights"]) > 0
+    frame_count = len(speedscope["shared"]["frames"])
+    assert all(0 <= id < frame_count for stack in profile["samples"] for id in stack)
+
+    with open(os.path.join(profiler.directory, name + ".summary.json")) as f:
+        summary = json.load(f)
+    assert summary["endpoint"] == "show_venue"
+    assert summary["self"] and summary["total"]
+    assert any('FROM "Show"' in entry["statement"] for entry in summary["sql"])
+
+
+def test_wrong_or_missing_token_is_not_profiled(app, profiler):
+    client = app.test_client()
+    assert "X-Profile" not in client.get("/", headers={"X-Profile": "guess"}).headers
+    assert "X-Profile" not in client.get("/").headers
+    response = client.get("/", headers={"X-Profile": "sécret"})
+    assert response.status_code == 200 and "X-Profile" not in response.headers
+    assert os.listdir(profiler.directory) == []
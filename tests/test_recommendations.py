@@ -0,0 +1,92 @@
+import random
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+import recommendations
+from models import db, Artist, SimilarArtist
+from recommendations import GENRES, jaccard, top_k_neighbours
+
+
+def random_genres(rng, count, most):
+    matrix = np.zeros((count, len(GENRES)), dtype=np.float32)
+    for row in matrix:
+        row[rng.sample(range(len(GENRES)), rng.randint(0, most))] = 1
+    return matrix
+
+
+def brute_force(query, target, k, exclude_self):
+    # best k positive scores per query row, one row at a time
+    expected = {}
+    for i, scores in enumerate(jaccard(query, target)):
+        if exclude_self:
+            scores = scores.copy()
+            scores[i] = 0
+        scores = np.sort(scores[scores > 0])[::-1][:k]
+        expected[i] = [round(float(score), 5) for score in scores]
+    return expected
+
+
+@pytest.mark.parametrize("exclude_self", [True, False])
+@pytest.mark.parametrize("count", [1, 7, 400])
+def test_top_k_neighbours_matches_brute_force(count, exclude_self):
+    rng = random.Random(count)
+    query = random_genres(rng, count, 3)
+    target = query if exclude_self else random_genres(rng, max(1, count // 3), 3)
+
+    found = defaultdict(list)
+    for q, t, score in zip(*top_k_neighbours(query, target, 10, exclude_self)):
+        assert not (exclude_self and q == t)
+        assert score == pytest.approx(jaccard(query[[q]], target[[t]])[0, 0])
+        found[int(q)].append(round(float(score), 5))
+
+    expected = brute_force(query, target, 10, exclude_self)
+    assert {i: found.get(i, []) for i in expected} == expected
+
+
+def score_lists():
+    lists = defaultdict(list)
+    rows = db.session.query(SimilarArtist.artist_id, SimilarArtist.score).order_by(
+        SimilarArtist.artist_id, SimilarArtist.score.desc()
+    )
+    for artist_id, score in rows:
+        lists[artist_id].append(round(score, 5))
+    return dict(lists)
+
+
+def test_update_artist_enters_other_artists_lists(app):
+    # updates queued by earlier requests would race the rebuild below
+    recommendations.updates.wait()
+    with app.app_context():
+        recommendations.rebuild_all()
+        artist = Artist(
+            name="Incremental",
+            city="Austin",
+            state="TX",
+            phone="555",
+            genres=["Jazz", "Blues"],
+        )
+        db.session.add(artist)
+        db.session.commit()
+
+        recommendations.update_artist(artist)
+        incremental = score_lists()
+        assert SimilarArtist.query.filter_by(similar_artist_id=artist.id).count()
+
+        recommendations.rebuild_all()
+        assert incremental == score_lists()
+
+        db.session.delete(artist)
+        db.session.commit()
+
+
+def test_failed_background_update_is_logged(app, monkeypatch, caplog):
+    def fail(artist):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(recommendations, "update_artist", fail)
+    with app.app_context():
+        artist_id = db.session.query(Artist.id).limit(1).scalar()
+    recommendations.updates.submit(artist_id).result()
+    assert f"could not be updated for artist {artist_id}" in caplog.text
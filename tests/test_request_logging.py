@@ -0,0 +1,27 @@
+from flask import Flask
+from flask.logging import default_handler
+
+import request_logging
+
+
+def logger_handlers(tmp_path, debug):
+    app = Flask(f"logging_debug_{debug}")
+    app.config.update(
+        DEBUG=debug,
+        LOG_FILE=str(tmp_path / f"debug_{debug}.log"),
+        LOG_LEVEL="INFO",
+        LOG_SUCCESS_SAMPLE_RATE=1.0,
+    )
+    # Flask only adds it when nothing above handles the level, and pytest's
+    # capture handler on the root logger does
+    app.logger.addHandler(default_handler)
+    request_logging.init_app(app)
+    handlers = list(app.logger.handlers)
+    for handler in handlers:
+        app.logger.removeHandler(handler)
+    return handlers
+
+
+def test_stderr_handler_stays_in_debug_mode_only(tmp_path):
+    assert default_handler in logger_handlers(tmp_path, debug=True)
+    assert default_handler not in logger_handlers(tmp_path, debug=False)
@@ -0,0 +1,173 @@
+import queue
+
+import pytest
+
+from models import db, Show, ShowEvent
+
+
+@pytest.fixture(autouse=True)
+def room_for_subscribers(monkeypatch):
+    from show_feed import show_feed
+
+    # the tests run without gevent, where only a stream or two is admitted
+    monkeypatch.setattr(show_feed, "max_subscribers", 10)
+
+
+def next_event(subscriber, timeout=5):
+    try:
+        return subscriber.events.get(timeout=timeout)
+    except queue.Empty:
+        raise AssertionError("no event dispatched") from None
+
+
+def test_created_show_reaches_matching_subscribers(app):
+    from show_feed import show_feed
+
+    venue_subscriber = show_feed.subscribe(venue_id=3)
+    other_subscriber = show_feed.subscribe(venue_id=4)
+    try:
+        response = app.test_client().post(
+            "/shows/create",
+            data={"artist_id": "5", "venue_id": "3", "start_time": "2032-01-01 20:00:00"},
+        )
+        assert response.status_code == 200
+
+        event = next_event(venue_subscriber)
+        assert event["kind"] == "created"
+        assert (event["venue_id"], event["artist_id"]) == (3, 5)
+        assert event["venue_name"] == "Venue 2"
+        assert event["start_time"] == "2032-01-01 20:00:00"
+        assert other_subscriber.events.empty()
+    finally:
+        show_feed.unsubscribe(venue_subscriber)
+        show_feed.unsubscribe(other_subscriber)
+
+
+def test_deleting_an_artist_records_its_upcoming_shows(app):
+    from datetime import datetime
+
+    from show_feed import show_feed
+
+    with app.app_context():
+        # an artist with past shows too, whichever months are archived by now
+        now = datetime.now()
+        artist_id = (
+            Show.query.with_entities(Show.artist_id)
+            .group_by(Show.artist_id)
+            .having(db.func.min(Show.start_time) < now)
+            .having(db.func.max(Show.start_time) >= now)
+            .order_by(Show.artist_id)
+            .limit(1)
+            .scalar()
+        )
+        shows = Show.query.with_entities(Show.id, Show.start_time).filter_by(
+            artist_id=artist_id
+        )
+        show_ids = {id for id, start_time in shows if start_time >= now}
+        assert show_ids and len(show_ids) < shows.count()
+        last_id = ShowEvent.query.with_entities(ShowEvent.id).order_by(
+            ShowEvent.id.desc()
+        ).limit(1).scalar() or 0
+
+    assert app.test_client().delete(f"/artists/{artist_id}").status_code == 302
+
+    with app.app_context():
+        missed = show_feed.missed(last_id, artist_id=artist_id)
+    assert {event["show_id"] for event in missed} == show_ids
+    assert {event["kind"] for event in missed} == {"deleted"}
+    # the artist is gone, the venue names are still filled in
+    assert all(event["artist_name"] is None and event["venue_name"] for event in missed)
+
+
+def test_threaded_workers_admit_few_streams(app, monkeypatch):
+    from show_feed import show_feed
+
+    show_feed.init_app(app)
+    assert show_feed.max_subscribers == app.config["EVENTS_MAX_THREADED_SUBSCRIBERS"]
+    assert show_feed.max_subscribers < app.config["EVENTS_MAX_SUBSCRIBERS"]
+
+    subscribers = [show_feed.subscribe() for _ in range(show_feed.max_subscribers)]
+    try:
+        response = app.test_client().get("/events/shows")
+        assert response.status_code == 503
+    finally:
+        for subscriber in subscribers:
+            show_feed.unsubscribe(subscriber)
+
+
+def test_editing_an_artist_records_only_upcoming_shows(app):
+    from datetime import datetime
+
+    from show_feed import show_feed
+
+    with app.app_context():
+        shows = Show.query.with_entities(Show.id, Show.start_time).filter_by(artist_id=9)
+        upcoming = {id for id, start_time in shows if start_time >= datetime.now()}
+        assert upcoming and len(upcoming) < shows.count()
+        last_id = ShowEvent.query.with_entities(ShowEvent.id).order_by(
+            ShowEvent.id.desc()
+        ).limit(1).scalar() or 0
+
+    response = app.test_client().post(
+        "/artists/9/edit",
+        data={
+            "name": "Artist 8 (renamed)",
+            "city": "San Francisco",
+            "state": "CA",
+            "phone": "555-000-0000",
+            "genres": ["Jazz"],
+            "image_link": "",
+            "facebook_link": "",
+            "website_link": "",
+            "seeking_description": "",
+        },
+    )
+    assert response.status_code == 302
+
+    with app.app_context():
+        missed = show_feed.missed(last_id, artist_id=9)
+    assert {event["show_id"] for event in missed} == upcoming
+    assert {event["kind"] for event in missed} == {"updated"}
+
+
+def test_events_committed_after_a_gap_are_still_delivered(app, monkeypatch):
+    from sqlalchemy import text
+
+    from models import db
+    from show_feed import ShowFeed, Subscriber
+
+    def add_event(connection):
+        return connection.execute(
+            text(
+                'INSERT INTO "ShowEvent" '
+                "(kind, show_id, venue_id, artist_id, start_time) "
+                "VALUES ('created', 1, 1, 1, '2032-01-01') RETURNING id"
+            )
+        ).scalar()
+
+    feed = ShowFeed()
+    feed.init_app(app)
+    monkeypatch.setattr(feed, "gap_seconds", 0)
+    subscriber = Subscriber(None, None, 10)
+    feed.subscribers.add(subscriber)
+
+    with app.app_context():
+        feed.last_id = db.session.query(db.func.max(ShowEvent.id)).scalar() or 0
+        with db.engine.connect() as slow:
+            # a long transaction holds the lower id while a later one commits
+            slow_id = add_event(slow)
+            with db.engine.begin() as quick:
+                quick_id = add_event(quick)
+
+            feed.poll()
+            assert next_event(subscriber, timeout=0)["id"] == quick_id
+            assert subscriber.events.empty()
+
+            slow.commit()
+        feed.poll()
+        assert next_event(subscriber, timeout=0)["id"] == slow_id
+        assert feed.gaps == []
+
+        feed.poll()
+        assert subscriber.events.empty()
+        db.session.remove()
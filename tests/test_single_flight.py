@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+@pytest.fixture
+def flight(app):
+    flight = SingleFlight()
+    flight.init_app(app)
+    return flight
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_concurrent_callers_run_fn_once(flight):
+    runs = []
+    release = threading.Event()
+
+    def work():
+        runs.append(threading.get_ident())
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do(("key", 1), work)))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    wait_until(lambda: runs)
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: flight.stats()["waiting"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(runs) == 1
+    assert results == ["result"] * 5
+    assert flight.stats() == {
+        "leaders": 1,
+        "deduplicated": 4,
+        "in_flight": 0,
+        "waiting": 0,
+    }
+
+
+def test_timed_out_waiter_is_not_counted_as_deduplicated(flight):
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do(("key", 1), release.wait))
+    leader.start()
+    wait_until(lambda: flight.stats()["in_flight"])
+
+    try:
+        assert flight.do(("key", 1), lambda: "own", timeout=0.05) == "own"
+    finally:
+        release.set()
+        leader.join()
+    assert flight.stats()["timeouts"] == 1
+    assert "deduplicated" not in flight.stats()
+
+
+def test_timeouts_are_per_key_name(flight):
+    flight.timeout = 5
+    flight.timeouts = {"search_venues": 0.5}
+    assert flight.timeout_for(("search_venues", "jazz")) == 0.5
+    assert flight.timeout_for(("show_venue", 3)) == 5
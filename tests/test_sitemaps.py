@@ -0,0 +1,63 @@
+import gzip
+import os
+import re
+
+import pytest
+
+from models import db, Artist, Venue
+from sitemaps import generate
+
+
+@pytest.fixture
+def small_segments(app):
+    size = app.config["SITEMAP_URLS"]
+    app.config["SITEMAP_URLS"] = 20
+    yield 20
+    app.config["SITEMAP_URLS"] = size
+
+
+def locs(path):
+    with gzip.open(path, "rt") as f:
+        return re.findall(r"<loc>([^<]*)</loc>", f.read())
+
+
+def test_segments_cover_every_page(app, small_segments, tmp_path):
+    with app.app_context():
+        generate(str(tmp_path))
+        venue_ids = sorted(id for id, in db.session.query(Venue.id))
+        artist_ids = sorted(id for id, in db.session.query(Artist.id))
+
+    base_url = app.config["SITEMAP_BASE_URL"]
+    listed = []
+    for name in sorted(os.listdir(tmp_path)):
+        if name.startswith("venues-"):
+            listed += locs(tmp_path / name)
+    assert sorted(listed) == sorted(f"{base_url}/venues/{id}" for id in venue_ids)
+
+    with open(tmp_path / "sitemap.xml") as f:
+        index = f.read()
+    segments = {segment for segment in os.listdir(tmp_path) if segment.endswith(".gz")}
+    assert len(segments) == len(re.findall(r"<sitemap>", index))
+    assert f"{base_url}/sitemaps/artists-{(artist_ids[-1] - 1) // 20 + 1}.xml.gz" in index
+
+
+def test_only_changed_segments_are_rewritten(app, small_segments, tmp_path):
+    with app.app_context():
+        generate(str(tmp_path))
+        assert generate(str(tmp_path)) == []
+
+        venue = db.session.get(Venue, 25)
+        venue.phone = "555-111-1111"
+        db.session.commit()
+        assert generate(str(tmp_path)) == ["venues-2.xml.gz", "sitemap.xml"]
+
+
+def test_sitemaps_are_served(app):
+    client = app.test_client()
+    index = client.get("/sitemap.xml")
+    assert index.status_code == 200
+    assert index.mimetype == "application/xml"
+    segment = client.get("/sitemaps/venues-1.xml.gz")
+    assert segment.status_code == 200
+    assert gzip.decompress(segment.data).startswith(b"<?xml")
+    assert client.get("/sitemaps/manifest.json").status_code == 404
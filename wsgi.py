@@ -0,0 +1,5 @@
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+import serving
+from app import app
+
+serving.warmup_master(app)